@@ -1,6 +1,11 @@
 from gint import *
 from random import randint
 
+try:
+    from gint import dline_many
+except ImportError:
+    dline_many = None
+
 # Configuration
 WIDTH, HEIGHT = 320, 528
 C_BG = C_WHITE
@@ -41,6 +46,26 @@ BULLET_LIFE = 45
 entities = []
 pending_add = []
 
+# Outline segments of the current pass (every entity of a pass is drawn in
+# the same color), sent in one dline_many() call by flush_outlines()
+outline_batch = [] if dline_many else None
+
+def outline(pts, color):
+    """Closed outline through pts"""
+    n = len(pts)
+    for i in range(n):
+        p1 = pts[i]
+        p2 = pts[(i+1) % n]
+        if outline_batch is None:
+            dline(p1[0], p1[1], p2[0], p2[1], color)
+        else:
+            outline_batch.extend((p1[0], p1[1], p2[0], p2[1]))
+
+def flush_outlines(color):
+    if outline_batch:
+        dline_many(outline_batch, color)
+        outline_batch.clear()
+
 class Entity:
     """Base class using Fixed-Point coordinates"""
     def __init__(self, x, y, radius_pixels):
@@ -142,9 +167,7 @@ class Ship(Entity):
         rx = cx + ((COS_LUT[a3] * 8) >> SHIFT)
         ry = cy + ((SIN_LUT[a3] * 8) >> SHIFT)
 
-        dline(nx, ny, lx, ly, color)
-        dline(lx, ly, rx, ry, color)
-        dline(rx, ry, nx, ny, color)
+        outline(((nx, ny), (lx, ly), (rx, ry)), color)
 
 class Rock(Entity):
     def __init__(self, x, y, size_tier):
@@ -195,10 +218,7 @@ class Rock(Entity):
             # Convert to pixels
             screen_pts.append((cx + (rx >> SHIFT), cy + (ry >> SHIFT)))
             
-        for i in range(len(screen_pts)):
-            p1 = screen_pts[i]
-            p2 = screen_pts[(i+1) % len(screen_pts)]
-            dline(p1[0], p1[1], p2[0], p2[1], color)
+        outline(screen_pts, color)
 
 class Bullet(Entity):
     def __init__(self, x, y, angle_idx):
@@ -264,6 +284,7 @@ def run():
         # ERASE OLD
         for e in entities: 
             if e.visible: e.draw(C_BG)
+        flush_outlines(C_BG)
         drect(0, 0, 100, 20, C_BG) # Clear HUD
         if game_over: drect(60, 200, 260, 300, C_BG)
 
@@ -345,6 +366,7 @@ def run():
         # DRAW NEW
         for e in entities:
             if e.visible: e.draw(C_FG)
+        flush_outlines(C_FG)
             
         dtext(5, 5, C_FG, f"Score: {score}")
         if game_over:
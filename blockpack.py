@@ -0,0 +1,281 @@
+# Block-indexed compressed container for PythonExtra
+#
+# The input is cut into blocks of block_size bytes, each compressed on its own
+# with the codec that suits it, so any byte is read back by decompressing a
+# single block: seek() is O(1) and reading page 300 of a document does not
+# decompress the 299 before it. Runs on the calculator; on the desktop pack()
+# compresses the blocks in parallel.
+
+import struct
+import compression
+import lzw
+
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+# =============================================================================
+# CONTAINER FORMAT
+# =============================================================================
+# Header (little-endian, 16 bytes):
+#   magic b'BLK1', block_size: uint32, size: uint32 (uncompressed),
+#   count: uint32 (blocks)
+# Index, count entries of 13 bytes:
+#   offset: uint32 (from the start of the container), length: uint32,
+#   codec: uint8, crc: uint32 (CRC-32 of the uncompressed block)
+# Blocks: the compressed blocks, in order. Every block holds block_size bytes
+# once decompressed, except the last one.
+
+MAGIC = b'BLK1'
+HEADER_FMT = "<4sIII"
+INDEX_FMT = "<IIBI"
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+INDEX_SIZE = struct.calcsize(INDEX_FMT)
+
+BLOCK_SIZE = 4096
+PARALLEL_MIN = 256 * 1024   # smaller inputs are not worth starting processes
+
+# Codec ids stored in the index
+CODEC_RAW = 0
+CODEC_LZ77 = 1
+CODEC_LZW = 2
+CODEC_RLE = 3
+CODEC_RLE16 = 4
+
+CODECS = {'raw': CODEC_RAW, 'lz77': CODEC_LZ77, 'lzw': CODEC_LZW,
+          'rle': CODEC_RLE, 'rle16': CODEC_RLE16}
+
+# Codecs tried by codec='auto', the smallest result wins
+AUTO_CODECS = ('lz77', 'lzw', 'rle16', 'rle')
+
+# =============================================================================
+# CHECKSUM
+# =============================================================================
+
+_crc_table = None
+
+def _crc32(data: bytes) -> int:
+    """CRC-32 (same as zlib/binascii), table-driven where binascii is missing"""
+    if crc32 is not None:
+        return crc32(data) & 0xffffffff
+    global _crc_table
+    if _crc_table is None:
+        _crc_table = []
+        for n in range(256):
+            c = n
+            for _ in range(8):
+                c = (0xedb88320 ^ (c >> 1)) if c & 1 else (c >> 1)
+            _crc_table.append(c)
+    table = _crc_table
+    c = 0xffffffff
+    for b in data:
+        c = table[(c ^ b) & 0xff] ^ (c >> 8)
+    return c ^ 0xffffffff
+
+# =============================================================================
+# CODECS
+# =============================================================================
+
+def _compress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_LZ77:
+        return compression.lz77_compress(data)
+    if codec == CODEC_LZW:
+        return lzw.pack(data)
+    if codec == CODEC_RLE:
+        return compression.rle_compress(data)
+    if codec == CODEC_RLE16:
+        return compression.rle16_compress(data)
+    return bytes(data)
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_RAW:
+        return bytes(data)
+    if codec == CODEC_LZ77:
+        return compression.lz77_decompress(data)
+    if codec == CODEC_LZW:
+        return lzw.unpack(data)
+    if codec == CODEC_RLE:
+        return compression.rle_decompress(data)
+    if codec == CODEC_RLE16:
+        return compression.rle16_decompress(data)
+    raise ValueError("Unknown block codec %d" % codec)
+
+def compress_block(name: str, data: bytes) -> tuple:
+    """
+    Compress one block with the named codec (or 'auto'), returns
+    (codec id, payload, crc). The block is stored raw when the codec does
+    not make it smaller.
+    """
+    if name == 'auto':
+        names = AUTO_CODECS
+    else:
+        if name not in CODECS:
+            raise ValueError("Unknown codec " + repr(name))
+        names = (name,)
+    best = CODEC_RAW
+    payload = data
+    for candidate in names:
+        codec = CODECS[candidate]
+        if codec == CODEC_RAW or (codec == CODEC_RLE16 and len(data) & 1):
+            continue
+        out = _compress(codec, data)
+        if len(out) < len(payload):
+            best = codec
+            payload = out
+    return best, bytes(payload), _crc32(data)
+
+def _compress_job(job):
+    return compress_block(job[0], job[1])
+
+# =============================================================================
+# WRITER
+# =============================================================================
+
+def pack(data: bytes, block_size: int = BLOCK_SIZE, codec='lz77',
+         workers: int = None) -> bytes:
+    """
+    Compress data into a block container.
+
+    codec is a codec name ('lz77', 'lzw', 'rle', 'rle16', 'raw'), 'auto' to
+    keep the smallest result for every block, or a function (index, block)
+    returning one of those names, to select the codec block by block.
+
+    Where concurrent.futures is available, blocks are compressed in a pool
+    of workers processes: by default one per CPU, for inputs of at least
+    PARALLEL_MIN bytes. workers=1 compresses in this process.
+    """
+    if block_size <= 0:
+        raise ValueError("block_size must be positive")
+    mv = memoryview(data)
+    count = (len(data) + block_size - 1) // block_size
+    jobs = []
+    for i in range(count):
+        block = bytes(mv[i * block_size:(i + 1) * block_size])
+        jobs.append((codec(i, block) if callable(codec) else codec, block))
+
+    results = None
+    if (ProcessPoolExecutor is not None and workers != 1 and count > 1
+            and (workers or len(data) >= PARALLEL_MIN)):
+        try:
+            with ProcessPoolExecutor(workers) as pool:
+                results = list(pool.map(_compress_job, jobs,
+                                        chunksize=max(1, count // 64)))
+        except (OSError, NotImplementedError, RuntimeError):
+            results = None      # no processes here, compress in place
+    if results is None:
+        results = [_compress_job(job) for job in jobs]
+
+    out = bytearray(struct.pack(HEADER_FMT, MAGIC, block_size, len(data), count))
+    offset = HEADER_SIZE + count * INDEX_SIZE
+    for codec_id, payload, crc in results:
+        out += struct.pack(INDEX_FMT, offset, len(payload), codec_id, crc)
+        offset += len(payload)
+    for _, payload, _ in results:
+        out += payload
+    return bytes(out)
+
+def unpack(packed: bytes) -> bytes:
+    """Decompress a whole block container, checking every block."""
+    reader = BlockReader(packed)
+    out = bytearray()
+    for i in range(reader.count):
+        out += reader.block(i)
+    return bytes(out)
+
+# =============================================================================
+# READER
+# =============================================================================
+
+class BlockReader:
+    """
+    Random access to a block container held in memory (bytes, bytearray)
+    or in a file opened in binary mode. Only the index and the last block
+    read are kept in memory.
+
+        reader = BlockReader(open("book.blk", "rb"))
+        reader.seek(300 * 4096)
+        page = reader.read(4096)
+    """
+    def __init__(self, source):
+        self.source = source
+        self.is_file = hasattr(source, "read")
+        magic, self.block_size, self.size, self.count = struct.unpack(
+            HEADER_FMT, self._read_at(0, HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError("Not a block container")
+        self.index = self._read_at(HEADER_SIZE, self.count * INDEX_SIZE)
+        if len(self.index) != self.count * INDEX_SIZE:
+            raise ValueError("Truncated block container")
+        self.pos = 0
+        self._cached = -1
+        self._block = b""
+
+    def _read_at(self, offset: int, n: int) -> bytes:
+        if self.is_file:
+            self.source.seek(offset)
+            return self.source.read(n)
+        return bytes(self.source[offset:offset + n])
+
+    def entry(self, i: int) -> tuple:
+        """(offset, length, codec, crc) of block i"""
+        return struct.unpack_from(INDEX_FMT, self.index, i * INDEX_SIZE)
+
+    def block(self, i: int) -> bytes:
+        """Decompressed block i, checked against its CRC-32"""
+        if i == self._cached:
+            return self._block
+        if not 0 <= i < self.count:
+            raise IndexError("block index out of range")
+        offset, length, codec, crc = self.entry(i)
+        payload = self._read_at(offset, length)
+        if len(payload) != length:
+            raise ValueError("Truncated block container")
+        data = _decompress(codec, payload)
+        expected = min(self.block_size, self.size - i * self.block_size)
+        if len(data) != expected or _crc32(data) != crc:
+            raise ValueError("Block %d is corrupt" % i)
+        self._cached = i
+        self._block = data
+        return data
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self.pos
+
+    def readinto(self, buf) -> int:
+        """Read into buf (bytearray or memoryview), return the byte count"""
+        dst = memoryview(buf)
+        n = min(len(dst), max(0, self.size - self.pos))
+        done = 0
+        while done < n:
+            i, start = divmod(self.pos, self.block_size)
+            block = self.block(i)
+            k = min(n - done, len(block) - start)
+            dst[done:done + k] = memoryview(block)[start:start + k]
+            done += k
+            self.pos += k
+        return done
+
+    def read(self, size: int = -1) -> bytes:
+        """Up to size bytes from the current position (everything if size < 0)"""
+        left = max(0, self.size - self.pos)
+        if size < 0 or size > left:
+            size = left
+        buf = bytearray(size)
+        self.readinto(buf)
+        return bytes(buf)
@@ -1,4 +1,5 @@
 import gint
+from sprites import Layer, Sprite
 
 # Simple logo (monochrome, black on white)
 DVD = [
@@ -23,13 +24,14 @@ DVD = [
 DVD_W = 23
 DVD_H = 16
 
-# Draw the logo at (x, y)
-def draw_logo(x, y, color=gint.C_BLACK, bg=gint.C_WHITE):
-    for dy in range(DVD_H):
-        for dx in range(DVD_W):
-            if 0 <= x+dx < gint.DWIDTH and 0 <= y+dy < gint.DHEIGHT:
-                pixel = DVD[dy][dx]
-                gint.dpixel(x+dx, y+dy, color if pixel == '#' else bg)
+# The logo as an RGB565 image, drawn by a sprite layer: every frame only the
+# area it left is restored and the area it moved to is redrawn
+def logo_image(color, bg):
+    data = bytearray()
+    for row in DVD:
+        for pixel in row:
+            data += (color if pixel == '#' else bg).to_bytes(2, 'big')
+    return gint.image_rgb565(DVD_W, DVD_H, bytes(data))
 
 # Initial position and speed
 x, y = 50, 50
@@ -41,9 +43,12 @@ fg = gint.C_BLACK
 
 
 
+layer = Layer(bg)
+logo = layer.add(Sprite(logo_image(fg, bg), x, y))
+
 while True:
-    gint.dclear(bg)
-    draw_logo(x, y, fg, bg)
+    logo.move(x, y)
+    layer.draw()
     gint.dupdate()
 
     # Move
@@ -49,11 +49,8 @@ class ResultsActivity:
         t1 = time.monotonic()
         self.comp_time = t1 - t0
         
-        # Determine Size
-        if isinstance(self.compressed, list):
-            self.comp_size = len(self.compressed) * 2 # Approx 16-bit codes
-        else:
-            self.comp_size = len(self.compressed)
+        # Determine Size (every algorithm returns the bytes it would store)
+        self.comp_size = len(self.compressed)
             
         mem_mid = gc.mem_free()
         self.heap_delta = abs(mem_start - mem_mid)
@@ -157,7 +154,7 @@ class CompressionApp:
     def __init__(self):
         self.algorithms = [
             ("LZ77 (Packed Bytes)", comp.lz77_compress, comp.lz77_decompress),
-            ("LZW (Dictionary)", comp.lzw_compress, comp.lzw_decompress),
+            ("LZW (Dictionary)", comp.lzw_pack, comp.lzw_unpack),
             ("RLE (Run-Length)", comp.rle_compress, comp.rle_decompress)
         ]
         
@@ -6,36 +6,101 @@
 # Best for 200KB Markdown text. Low memory footprint, blazing fast decompression.
 # =============================================================================
 
-def lz77_compress(data: bytes) -> bytes:
+LZ77_WINDOW = 2047      # farthest back-reference
+LZ77_MAX_MATCH = 10     # longest match (3 bits of length)
+LZ77_CHAIN = 128        # candidates examined per position
+
+class _LZ77MatchFinder:
+    """
+    Hash chains over 3-byte prefixes: head[h] is the latest position whose
+    prefix hashes to h, and prev[p & 2047] the position before p with the
+    same hash. Only the window is kept, so memory does not grow with input.
+    """
+    def __init__(self, data: bytes, chain: int):
+        self.data = data
+        self.chain = chain
+        self.head = [-1] * 4096
+        self.prev = [-1] * 2048
+        self.inserted = 0
+        self.last = len(data) - 2
+        # Rolling hash of the 3 bytes at self.inserted - 1
+        self.hash = ((data[0] << 4) ^ data[1]) if len(data) > 2 else 0
+
+    def find(self, i: int, best: int = 2) -> int:
+        """
+        (length << 12) | distance of the longest match at i that is longer
+        than best, 0 if none.
+        """
+        data = self.data
+        if i >= self.last:
+            return 0
+        head = self.head
+        prev = self.prev
+        h = self.hash
+        if i > self.inserted:
+            for p in range(self.inserted, i):
+                h = ((h << 4) ^ data[p + 2]) & 0xfff
+                prev[p & 2047] = head[h]
+                head[h] = p
+            self.inserted = i
+            self.hash = h
+
+        j = head[((h << 4) ^ data[i + 2]) & 0xfff]
+        limit = i - LZ77_WINDOW
+        if limit < 0:
+            limit = 0
+        maxlen = len(data) - i
+        if maxlen > LZ77_MAX_MATCH:
+            maxlen = LZ77_MAX_MATCH
+        if best >= maxlen:
+            return 0
+        found = 0
+        n = self.chain
+        ib = i + best
+        target = data[ib]
+        while j >= limit and n:
+            # A candidate can only win if it also matches at the current best,
+            # then the bytes before it are checked at once
+            if data[j + best] == target and data[j:j + best] == data[i:ib]:
+                k = best + 1
+                while k < maxlen and data[j + k] == data[i + k]:
+                    k += 1
+                best = k
+                found = (k << 12) | (i - j)
+                if k == maxlen:
+                    break
+                ib = i + k
+                target = data[ib]
+            j = prev[j & 2047]
+            n -= 1
+        return found
+
+def lz77_compress(data: bytes, chain: int = LZ77_CHAIN, lazy: bool = True) -> bytes:
     """
     Compresses using an adapted text-optimized LZ77 algorithm.
     Excellent for Markdown and ASCII text.
+
+    chain bounds the candidates examined per position (more is slower but
+    finds longer matches). With lazy matching (the default), a match is given
+    up for a literal when the next position has a longer one.
     """
     out = bytearray()
     space = 0
-    sstart = 0
     i = 0
     imax = len(data)
+    finder = _LZ77MatchFinder(data, chain)
+    match = finder.find(0)
     
     while i < imax:
-        if (i - sstart) > 2047: 
-            sstart = i - 2047
-            
-        e = 3
-        ns = sstart
-        ts = data[i:i+e]
-        
-        while (imax - i) >= e and e <= 10:
-            f = data.find(ts, ns, i)
-            if f < 0: 
-                break
-            e += 1
-            ts = data[i:i+e]
-            ns = f
-        e -= 1
+        e = match >> 12
+        if lazy and 3 <= e < LZ77_MAX_MATCH:
+            following = finder.find(i + 1, e)
+            if following:
+                e = 0
+                match = following
         
         if e >= 3:
-            dist = i - ns
+            dist = match & 0xfff
             byte_val = (dist << 3) | (e - 3)
             if space:
                 out.append(32)
@@ -43,6 +108,7 @@ def lz77_compress(data: bytes) -> bytes:
             out.append(0x80 | (byte_val >> 8))
             out.append(byte_val & 0xff)
             i += e
+            match = finder.find(i)
         else:
             c = data[i]
             i += 1
@@ -66,6 +132,9 @@ def lz77_compress(data: bytes) -> bytes:
                     else:
                         out.append(1)
                         out.append(c)
+            # A match deferred by lazy matching now starts at i
+            if e or not match:
+                match = finder.find(i)
                         
     if space: 
         out.append(32)
@@ -106,52 +175,147 @@ def lz77_decompress(data: bytes) -> bytes:
                     
     return bytes(o)
 
+LZ77_CHUNK = 512        # bytes per chunk when iterating over an LZ77Decoder
+
+class LZ77Decoder:
+    """
+    Streaming lz77_decompress. Output is read in pieces, with readinto(),
+    read() or by iterating over fixed-size chunks, and the only history kept
+    is the 2047-byte back-reference window (a 2048-byte ring that also holds
+    output not read yet), so memory does not grow with the output.
+
+    Input can arrive in pieces too: feed() compressed bytes as they come and
+    finish() after the last ones; a token cut by the end of the input waits
+    for the next feed(). reset() starts over for an independent stream, such
+    as the next MOBI text record, reusing the window.
+
+        decoder = LZ77Decoder(record)
+        for chunk in decoder:
+            ...
+    """
+    def __init__(self, data: bytes = None, chunk_size: int = LZ77_CHUNK):
+        self.chunk_size = chunk_size
+        self.window = bytearray(LZ77_WINDOW + 1)
+        self._view = memoryview(self.window)
+        self.reset(data)
+
+    def reset(self, data: bytes = None):
+        """Start a new stream, with all of its input if data is given"""
+        self.data = b""
+        self.x = 0
+        self.final = False
+        self.produced = 0       # bytes decoded into the window
+        self.delivered = 0      # bytes handed out to the reader
+        if data is not None:
+            self.feed(data)
+            self.finish()
+
+    def feed(self, data: bytes):
+        """Add compressed input"""
+        if self.final:
+            raise ValueError("LZ77Decoder input already finished")
+        self.data = self.data[self.x:] + data
+        self.x = 0
+
+    def finish(self):
+        """No more input: the end of the data is the end of the stream"""
+        self.final = True
+
+    def _fill(self):
+        """Decode tokens until the window is full of output not read yet"""
+        data = self.data
+        x = self.x
+        n_data = len(data)
+        final = self.final
+        window = self.window
+        mask = LZ77_WINDOW
+        p = self.produced
+        stop = self.delivered + LZ77_WINDOW + 1 - LZ77_MAX_MATCH
+
+        while p <= stop and x < n_data:
+            c = data[x]
+            if 0 < c < 9:
+                if x + c >= n_data and not final:
+                    break
+                x += 1
+                for _ in range(c):
+                    if x < n_data:
+                        window[p & mask] = data[x]
+                        p += 1
+                        x += 1
+            elif c < 128:
+                window[p & mask] = c
+                p += 1
+                x += 1
+            elif c >= 0xc0:
+                window[p & mask] = 32
+                window[(p + 1) & mask] = c & 0x7f
+                p += 2
+                x += 1
+            else:
+                if x + 1 >= n_data:
+                    if not final:
+                        break
+                    x += 1
+                    continue
+                val = ((c & 0x3f) << 8) | data[x + 1]
+                x += 2
+                m = val >> 3
+                if m == 0 or p == 0:
+                    raise ValueError("Bad LZ77 back-reference")
+                start = p - m
+                if start < 0: start = 0
+                for _ in range((val & 7) + 3):
+                    window[p & mask] = window[start & mask]
+                    p += 1
+                    start += 1
+
+        self.x = x
+        self.produced = p
+
+    def readinto(self, buf) -> int:
+        """Decode into buf (bytearray or memoryview), return the byte count"""
+        size = len(buf)
+        done = 0
+        view = self._view
+        while done < size:
+            avail = self.produced - self.delivered
+            if not avail:
+                self._fill()
+                avail = self.produced - self.delivered
+                if not avail:
+                    break
+            start = self.delivered & LZ77_WINDOW
+            n = min(avail, size - done, LZ77_WINDOW + 1 - start)
+            buf[done:done + n] = view[start:start + n]
+            self.delivered += n
+            done += n
+        return done
+
+    def read(self, size: int = -1) -> bytes:
+        """Up to size decoded bytes (everything left if size < 0)"""
+        if size >= 0:
+            buf = bytearray(size)
+            n = self.readinto(buf)
+            return bytes(buf) if n == size else bytes(buf[:n])
+        return b"".join(self)
+
+    def __iter__(self):
+        buf = bytearray(self.chunk_size)
+        while True:
+            n = self.readinto(buf)
+            if not n:
+                return
+            yield bytes(buf[:n])
+
 # =============================================================================
 # LZW (Lempel-Ziv-Welch)
+# Integer-keyed trie dictionary, shared with lzw.py (see there).
+# lzw_pack stores the codes 9 to 16 bits wide in a small container.
 # =============================================================================
 
-def lzw_compress(data: bytes) -> list:
-    if not data: 
-        return []
-    
-    dict_size = 256
-    dictionary = {bytes([i]): i for i in range(dict_size)}
-    
-    w = bytes()
-    compressed_data = []
-    
-    # Iterating over 'bytes' yields integers directly
-    for b in data:
-        c = bytes([b])
-        wc = w + c
-        if wc in dictionary:
-            w = wc
-        else:
-            compressed_data.append(dictionary[w])
-            dictionary[wc] = dict_size
-            dict_size += 1
-            w = c
-            
-    if w: 
-        compressed_data.append(dictionary[w])
-        
-    return compressed_data
-
-def lzw_decompress(compressed_data: list) -> bytes:
-    if not compressed_data: return b""
-    dict_size = 256
-    dictionary = {i: bytes([i]) for i in range(dict_size)}
-    w = dictionary[compressed_data[0]]
-    result = [w]
-    for k in compressed_data[1:]:
-        if k in dictionary: entry = dictionary[k]
-        elif k == dict_size: entry = w + w[:1]
-        else: raise ValueError("Bad code")
-        result.append(entry)
-        dictionary[dict_size] = w + entry[:1]
-        dict_size += 1
-        w = entry
-    return b"".join(result)
+from lzw import compress as lzw_compress, decompress as lzw_decompress
+from lzw import pack as lzw_pack, unpack as lzw_unpack
 
 # =============================================================================
 # RLE (Run-Length Encoding)
@@ -179,4 +343,114 @@ def rle_decompress(data: bytes) -> bytes:
     mv = memoryview(data)
     for i in range(0, len(mv), 2):
         res.extend(bytes([mv[i]]) * mv[i+1])
-    return bytes(res)
\ No newline at end of file
+    return bytes(res)
+
+# =============================================================================
+# RLE16 (PackBits on 16-bit words)
+# For RGB565 pixel buffers (cpaint_demo canvases, gint image data): runs are
+# counted in whole pixels and non-repetitive stretches cost one header byte
+# per 128 pixels instead of doubling. Byte order is kept as is.
+# =============================================================================
+
+RLE16_MAX_LITERAL = 128     # words per literal packet (header 0x00-0x7f)
+RLE16_MAX_RUN = 129         # words per run packet (header 0x80-0xff)
+
+def rle16_compress(data: bytes) -> bytes:
+    """
+    Compresses 16-bit words into packets: a header h < 0x80 is followed by
+    h + 1 literal words, a header h >= 0x80 by one word repeated h - 126
+    times.
+    """
+    n = len(data)
+    if n & 1:
+        raise ValueError("RLE16 needs an even number of bytes")
+    out = bytearray()
+    mv = memoryview(data)
+    lit = 0             # start of the pending literal words
+    i = 0
+
+    while i < n:
+        a = data[i]
+        b = data[i + 1]
+        j = i + 2
+        end = min(n, i + 2 * RLE16_MAX_RUN)
+        while j < end and data[j] == a and data[j + 1] == b:
+            j += 2
+        run = (j - i) >> 1
+        # A run of 2 only pays off when it does not split a literal packet
+        if run > 2 or (run == 2 and lit == i):
+            while lit < i:
+                k = min(i - lit, 2 * RLE16_MAX_LITERAL)
+                out.append((k >> 1) - 1)
+                out += mv[lit:lit + k]
+                lit += k
+            out.append(0x80 | (run - 2))
+            out.append(a)
+            out.append(b)
+            lit = j
+        i = j
+
+    while lit < n:
+        k = min(n - lit, 2 * RLE16_MAX_LITERAL)
+        out.append((k >> 1) - 1)
+        out += mv[lit:lit + k]
+        lit += k
+    return bytes(out)
+
+def rle16_size(data: bytes) -> int:
+    """Size in bytes of the RLE16 data once decompressed"""
+    x = 0
+    size = 0
+    n = len(data)
+    while x < n:
+        h = data[x]
+        if h < 0x80:
+            k = (h + 1) << 1
+            x += 1 + k
+        else:
+            k = (h - 126) << 1
+            x += 3
+        size += k
+    return size
+
+def rle16_decompress_into(data: bytes, out) -> int:
+    """
+    Decompresses RLE16 data into out, a preallocated bytearray or
+    memoryview, and returns the number of bytes written. Runs are filled
+    by doubling copies inside out, so nothing is allocated per packet.
+    """
+    src = memoryview(data)
+    dst = memoryview(out)
+    size = len(dst)
+    n = len(data)
+    x = 0
+    pos = 0
+
+    while x < n:
+        h = data[x]
+        if h < 0x80:
+            k = (h + 1) << 1
+            if x + 1 + k > n or pos + k > size:
+                raise ValueError("Bad RLE16 data")
+            dst[pos:pos + k] = src[x + 1:x + 1 + k]
+            x += 1 + k
+        else:
+            k = (h - 126) << 1
+            if x + 3 > n or pos + k > size:
+                raise ValueError("Bad RLE16 data")
+            dst[pos] = data[x + 1]
+            dst[pos + 1] = data[x + 2]
+            done = 2
+            while done < k:
+                m = min(done, k - done)
+                dst[pos + done:pos + done + m] = dst[pos:pos + m]
+                done += m
+            x += 3
+        pos += k
+    return pos
+
+def rle16_decompress(data: bytes) -> bytes:
+    """Decompresses RLE16 data back into bytes."""
+    out = bytearray(rle16_size(data))
+    rle16_decompress_into(data, out)
+    return bytes(out)
\ No newline at end of file
@@ -2,6 +2,7 @@ from gint import KEY_KBD
 from gint import *
 import cgui
 import cinput
+import compression
 import struct
 import math
 import random
@@ -14,6 +15,14 @@ try:
 except ImportError:
     pass
 
+# The desktop emulator ships a precomputed RGB565 -> RGB888 table and a
+# scaled RGB565 buffer blit
+try:
+    from gint import RGB565_TO_RGB888, dsubimage_rgb565
+except ImportError:
+    RGB565_TO_RGB888 = None
+    dsubimage_rgb565 = None
+
 # =============================================================================
 # APP CONFIG
 # =============================================================================
@@ -29,6 +38,9 @@ BUF_HEADER_OFFSET = HEADER_H
 
 MAX_JUMP = 70
 
+# Set in the width field of a GIP header when the pixels are RLE16 packets
+GIP_RLE16 = 0x80000000
+
 # =============================================================================
 # IMAGE & BUFFER MANAGEMENT
 # =============================================================================
@@ -74,6 +86,10 @@ class Canvas:
         sx = bx * 2
         sy = BUF_HEADER_OFFSET + by * 2
         
+        if dsubimage_rgb565:
+            dsubimage_rgb565(sx, sy, self.mv, cw * 2, bx, by, bw, bh, 2, 'little')
+            return
+        
         buf = self.mv
         
         # Draw line by line to minimize function calls
@@ -201,11 +217,12 @@ class Canvas:
 # =============================================================================
 
 def save_gip(canvas, filename):
-    # Save the small buffer directly
+    # Save the small buffer as RLE16 packets (runs of whole pixels)
     try:
+        data = compression.rle16_compress(canvas.buffer)
         with open(filename, "wb") as f:
-            f.write(struct.pack("<II", BUF_W, BUF_H))
-            f.write(canvas.buffer)
+            f.write(struct.pack("<II", BUF_W | GIP_RLE16, BUF_H))
+            f.write(data)
         cgui.msgbox("Saved GIP!")
     except Exception as e:
         cgui.msgbox(f"Error: {e}")
@@ -214,11 +231,19 @@ def load_gip(canvas, filename):
     try:
         with open(filename, "rb") as f:
             w, h = struct.unpack("<II", f.read(8))
+            packed = w & GIP_RLE16
+            w &= ~GIP_RLE16
             if w != BUF_W or h != BUF_H:
                 cgui.msgbox("Dim mismatch (Must be half-res)")
                 return
-            # Read directly into buffer, bypassing potential memoryview write issues
-            f.readinto(canvas.buffer)
+            if packed:
+                # Decode straight into the buffer, no full-size temporary
+                n = compression.rle16_decompress_into(f.read(), canvas.buffer)
+                if n != len(canvas.buffer):
+                    cgui.msgbox("Truncated GIP")
+            else:
+                # Read directly into buffer, bypassing potential memoryview write issues
+                f.readinto(canvas.buffer)
         canvas.draw_scaled() 
         cgui.msgbox("Loaded GIP")
     except Exception as e:
@@ -252,6 +277,7 @@ def save_bmp(canvas, filename):
             buf = canvas.buffer
             row_buf = bytearray(row_size)
             ptr = 0
+            lut = RGB565_TO_RGB888
             
             for y in range(BUF_H):
                 r_ptr = 0
@@ -261,6 +287,14 @@ def save_bmp(canvas, filename):
                     c = (hi << 8) | lo
                     ptr += 2
                     
+                    if lut:
+                        r8, g8, b8 = lut[c]
+                        row_buf[r_ptr] = b8
+                        row_buf[r_ptr+1] = g8
+                        row_buf[r_ptr+2] = r8
+                        r_ptr += 3
+                        continue
+                    
                     # Unpack RGB565
                     r5 = (c >> 11) & 0x1F
                     g6 = (c >> 5) & 0x3F
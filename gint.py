@@ -4,6 +4,15 @@ from pygame.locals import *
 import sys
 import os
 import struct
+import zlib
+import array
+import atexit
+import hashlib
+import bisect
+import collections
+import itertools
+import tracemalloc
+import threading
 from typing import List, Optional, Tuple, Set
 
 
@@ -34,12 +43,31 @@ IMAGE_MONO = 0
 IMAGE_P4_RGB565 = 1
 IMAGE_RGB565 = 2
 
-# Pygame initialization
-pygame.init()
+# Backend selection: "window" opens a real pygame window, "headless" draws
+# into VRAM only (no window, no flip, no frame-rate sleep) for CI and benchmarks
+BACKEND_WINDOW = 'window'
+BACKEND_HEADLESS = 'headless'
+
+_backend = os.environ.get("GINT_BACKEND", BACKEND_WINDOW).lower()
+if _backend not in (BACKEND_WINDOW, BACKEND_HEADLESS):
+    _backend = BACKEND_WINDOW
+_sdl_driver = os.environ.get("SDL_VIDEODRIVER")
+if _backend == BACKEND_HEADLESS:
+    # Event and key functions still need a video driver, just not a window
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+# Pygame itself, the window and the font sheet are initialized on first use
+# (see _ensure_display() and _font_sheet()), so that tools and modules which
+# import gint without drawing do not pay for them
 
 # Check for scaling
 SCALE = 1
-if "GDK_SCALE" in os.environ:
+if "GINT_SCALE" in os.environ:
+    try:
+        SCALE = max(1, int(os.environ["GINT_SCALE"]))
+    except ValueError:
+        pass
+elif "GDK_SCALE" in os.environ:
     try:
         SCALE = int(os.environ["GDK_SCALE"])
     except ValueError:
@@ -50,36 +78,107 @@ elif "QT_SCALE_FACTOR" in os.environ:
     except ValueError:
         pass
 
-screen = pygame.display.set_mode((DWIDTH * SCALE, DHEIGHT * SCALE))
-pygame.display.set_caption("ClassPad")
+screen = None
+_display_ready = False
 vram = pygame.Surface((DWIDTH, DHEIGHT))
 clock = pygame.time.Clock()
 FPS = 100  # Adjust to control game speed
 
+# Integer scaling (SCALE > 1) of damaged regions into the window. With
+# SCALE_NEAREST, regions are scaled into a window-sized copy of VRAM
+# allocated once, then blitted; SCALE_PIXEL scales them straight into the
+# window surface when it has the same pixel format as VRAM (pixel-perfect,
+# no intermediate copy), and falls back to SCALE_NEAREST otherwise.
+SCALE_NEAREST = 'nearest'
+SCALE_PIXEL = 'pixel'
+_scale_mode = os.environ.get("GINT_SCALE_MODE", SCALE_NEAREST)
+_scaled = None               # scaled copy of VRAM (SCALE_NEAREST)
+_scale_direct = False        # regions are scaled into the window (SCALE_PIXEL)
+
+def _setup_scaling():
+    """Allocate the scaling target for the current window, mode and SCALE"""
+    global _scaled, _scale_direct
+    _scaled = None
+    _scale_direct = False
+    if screen is None or SCALE == 1:
+        return
+    _scale_direct = (_scale_mode == SCALE_PIXEL
+                     and screen.get_bitsize() == vram.get_bitsize()
+                     and screen.get_masks() == vram.get_masks())
+    if not _scale_direct:
+        _scaled = pygame.Surface(screen.get_size(), 0, vram)
+
+def _ensure_display():
+    """Initialize pygame and open the window on the first dupdate() or event
+    call (headless: only the dummy video driver, for events and keys)"""
+    global screen, _display_ready
+    if _display_ready:
+        return
+    _display_ready = True
+    pygame.init()
+    pygame.event.set_allowed(_allowed_events)
+    if _backend == BACKEND_WINDOW:
+        screen = pygame.display.set_mode((DWIDTH * SCALE, DHEIGHT * SCALE))
+        pygame.display.set_caption("ClassPad")
+        _setup_scaling()
+        _present(full=True)
+
+# Frame stepping: dupdate() counts frames, and exits the app once the limit
+# (GINT_FRAMES or init(frames=...)) is reached
+_frame_count = 0
+_frame_limit = None
+_frame_start = None
+_idle_polls = 0         # headless polls that found no event since the last frame
+try:
+    _frame_limit = int(os.environ.get("GINT_FRAMES", "0")) or None
+except ValueError:
+    pass
+
 #  NEW: Window Clipping State
 _dwindow = (0, 0, DWIDTH, DHEIGHT)
 
+# Damage tracking: primitives mark the 16x16 VRAM tiles they touched, and
+# dupdate() only pushes the dirty tiles (merged into rectangles) to the
+# window. Past DAMAGE_FULL_RATIO of dirty tiles, a full-frame update is used.
+DAMAGE_TILE = 16
+DAMAGE_FULL_RATIO = 0.5
+_TILES_X = (DWIDTH + DAMAGE_TILE - 1) // DAMAGE_TILE
+_TILES_Y = (DHEIGHT + DAMAGE_TILE - 1) // DAMAGE_TILE
+_dirty_tiles = bytearray(_TILES_X * _TILES_Y)
+_clean_tiles = bytes(_TILES_X * _TILES_Y)
+_dirty_run = memoryview(b'\x01' * _TILES_X)
+_damage_all = True  # The first frame is always pushed in full
+_damage_overlay = os.environ.get("GINT_SHOW_DAMAGE", "") not in ("", "0")
+_overlay_rects = []
+_damage_stats = {'frames_full': 0, 'frames_partial': 0, 'pixels_pushed': 0}
+
+# RGB565 -> RGB888 lookup table, built once at import and indexed by the
+# 16-bit color. Channels are expanded by bit replication (abcde -> abcdeabc),
+# which keeps the mapping exactly invertible by truncation.
+_EXPAND5 = [(v << 3) | (v >> 2) for v in range(32)]
+_EXPAND6 = [(v << 2) | (v >> 4) for v in range(64)]
+RGB565_TO_RGB888 = list(itertools.product(_EXPAND5, _EXPAND6, _EXPAND5))
+
 def _to_rgb(color: int) -> tuple:
-    """Convert RGB888 int to pygame color tuple"""
-    # return ((color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF)
-    # if it fits in 16 bits, decode RGB565 → RGB888
+    """Convert a gint color to a pygame color tuple"""
     if 0 <= color <= 0xFFFF:
-        r5 = (color >> 11) & 0x1F
-        g6 = (color >>  5) & 0x3F
-        b5 =  color        & 0x1F
-        # expand to 8 bits:   abcde → abcde00 | abcde>>3
-        r8 = (r5 << 3) | (r5 >> 2)
-        g8 = (g6 << 2) | (g6 >> 4)
-        b8 = (b5 << 3) | (b5 >> 2)
-        return (r8, g8, b8)
+        return RGB565_TO_RGB888[color]
     # otherwise assume it’s already RGB888
     return ((color >> 16) & 0xFF,
             (color >>  8) & 0xFF,
              color        & 0xFF)
 
 def _from_rgb(pixel: pygame.Color) -> int:
-    """Convert pygame color to RGB888 int"""
-    return (pixel[0] << 16) | (pixel[1] << 8) | pixel[2]
+    """Convert pygame color back to RGB565 (inverse of RGB565_TO_RGB888)"""
+    return ((pixel[0] & 0xF8) << 8) | ((pixel[1] & 0xFC) << 3) | (pixel[2] >> 3)
+
+def rgb565_to_rgb888(color: int) -> Tuple[int, int, int]:
+    """Expand an RGB565 color to an (r, g, b) tuple of 8-bit channels."""
+    return RGB565_TO_RGB888[color & 0xFFFF]
+
+def rgb888_to_rgb565(r: int, g: int, b: int) -> int:
+    """Pack 8-bit channels into RGB565."""
+    return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | ((b & 0xFF) >> 3)
 
 def C_RGB(r: int, g: int, b: int) -> int:
     """Create RGB888 from RGB555 components"""
@@ -102,26 +201,239 @@ def dwindow_set(left: int, top: int, right: int, bottom: int):
     clip_rect = pygame.Rect(left, top, right - left, bottom - top)
     vram.set_clip(clip_rect)
 
+def _damage(rect: Optional[pygame.Rect]):
+    """Mark the VRAM tiles covered by rect (as returned by pygame) as dirty"""
+    if _damage_all or not rect:
+        return
+    tx0 = max(rect.left, 0) // DAMAGE_TILE
+    ty0 = max(rect.top, 0) // DAMAGE_TILE
+    tx1 = (min(rect.right, DWIDTH) - 1) // DAMAGE_TILE
+    ty1 = (min(rect.bottom, DHEIGHT) - 1) // DAMAGE_TILE
+    if tx1 < tx0 or ty1 < ty0:
+        return
+    run = _dirty_run[:tx1 - tx0 + 1]
+    for ty in range(ty0, ty1 + 1):
+        i = ty * _TILES_X + tx0
+        _dirty_tiles[i:i + len(run)] = run
+
+def _damage_everything():
+    global _damage_all
+    _damage_all = True
+
+def _damage_rects() -> List[pygame.Rect]:
+    """Merge dirty tiles into rectangles: horizontal runs per tile row, then
+    runs spanning the same columns on consecutive rows"""
+    rects = []
+    open_runs = {}
+    T = DAMAGE_TILE
+    for ty in range(_TILES_Y):
+        row = _dirty_tiles[ty * _TILES_X:(ty + 1) * _TILES_X]
+        runs = {}
+        start = row.find(1)
+        while start >= 0:
+            end = row.find(0, start)
+            if end < 0:
+                end = _TILES_X
+            rect = open_runs.get((start, end))
+            if rect is None:
+                rect = pygame.Rect(start * T, ty * T, (end - start) * T, T)
+                rects.append(rect)
+            else:
+                rect.height += T
+            runs[(start, end)] = rect
+            start = row.find(1, end)
+        open_runs = runs
+    screen_rect = vram.get_rect()
+    return [r.clip(screen_rect) for r in rects]
+
+def damage_set(threshold: Optional[float] = None, overlay: Optional[bool] = None):
+    """
+    Configure partial display updates.
+
+    Args:
+        threshold: fraction of dirty VRAM above which dupdate() pushes the
+            full frame (0 always pushes full frames)
+        overlay: outline the damaged regions in the window (debug)
+    """
+    global DAMAGE_FULL_RATIO, _damage_overlay
+    if threshold is not None:
+        DAMAGE_FULL_RATIO = threshold
+    if overlay is not None:
+        _damage_overlay = overlay
+        _damage_everything()
+
+def damage_stats() -> dict:
+    """Counters of full/partial frames and pixels pushed to the window."""
+    return dict(_damage_stats)
+
 # Drawing functions
 def dclear(color: int):
     if color == C_NONE:
         return
-    vram.fill(_to_rgb(color))
+    _damage(vram.fill(_to_rgb(color)))
 
 def dupdate():
     """Update display with VRAM changes"""
+    _ensure_display()
+    if screen is not None:
+        _present()
+        clock.tick(FPS)
+    else:
+        _reset_damage()
+    if _capture is not None:
+        _capture.push()
+    _next_frame()
+
+def _reset_damage():
+    global _damage_all
+    _dirty_tiles[:] = _clean_tiles
+    _damage_all = False
+
+def _push_region(rect: pygame.Rect) -> pygame.Rect:
+    """Copy a VRAM rectangle to the window, return the window area covered"""
     if SCALE == 1:
-        screen.blit(vram, (0, 0))
+        screen.blit(vram, rect.topleft, rect)
+        return rect
+    dest = pygame.Rect(rect.x * SCALE, rect.y * SCALE, rect.w * SCALE, rect.h * SCALE)
+    src = vram if rect.size == vram.get_size() else vram.subsurface(rect)
+    if _scale_direct:
+        pygame.transform.scale(src, dest.size, screen.subsurface(dest))
+    else:
+        pygame.transform.scale(src, dest.size, _scaled.subsurface(dest))
+        screen.blit(_scaled, dest.topleft, dest)
+    return dest
+
+def scale_set(scale: Optional[int] = None, mode: Optional[str] = None):
+    """
+    Change the window scale factor or scaling mode (SCALE_NEAREST or
+    SCALE_PIXEL), GINT_SCALE and GINT_SCALE_MODE at startup.
+    """
+    global SCALE, _scale_mode, screen
+    if mode is not None:
+        if mode not in (SCALE_NEAREST, SCALE_PIXEL):
+            raise ValueError(f"Unknown scaling mode: {mode}")
+        _scale_mode = mode
+    if scale is not None and scale != SCALE:
+        SCALE = max(1, scale)
+        if screen is not None:
+            screen = pygame.display.set_mode((DWIDTH * SCALE, DHEIGHT * SCALE))
+    _setup_scaling()
+    _damage_everything()
+
+def _present(full: bool = False):
+    """Push the damaged parts of VRAM (or all of it) to the window."""
+    global _overlay_rects
+    # Regions outlined by the overlay last frame must be repainted
+    for rect in _overlay_rects:
+        _damage(rect)
+
+    dirty = _dirty_tiles.count(1)
+    if full or _damage_all or dirty > DAMAGE_FULL_RATIO * len(_dirty_tiles):
+        rects = [vram.get_rect()]
+        _push_region(rects[0])
+        _damage_stats['frames_full'] += 1
+        updated = None
     else:
-        scaled = pygame.transform.scale(vram, (DWIDTH * SCALE, DHEIGHT * SCALE))
-        screen.blit(scaled, (0, 0))
-    pygame.display.flip()
-    clock.tick(FPS)
+        rects = _damage_rects()
+        updated = [_push_region(rect) for rect in rects]
+        _damage_stats['frames_partial'] += 1
+    _damage_stats['pixels_pushed'] += sum(r.w * r.h for r in rects)
+
+    _overlay_rects = []
+    if _damage_overlay:
+        for rect in rects:
+            pygame.draw.rect(screen, (255, 0, 255), pygame.Rect(
+                rect.x * SCALE, rect.y * SCALE, rect.w * SCALE, rect.h * SCALE), 1)
+        _overlay_rects = list(rects)
+    if _profile_hud:
+        hud = _draw_profile_hud()
+        _overlay_rects.append(hud)
+        if updated is not None:
+            updated.append(pygame.Rect(hud.x * SCALE, hud.y * SCALE,
+                                       hud.w * SCALE, hud.h * SCALE))
+
+    if updated is None:
+        pygame.display.flip()
+    elif updated:
+        pygame.display.update(updated)
+    _reset_damage()
+
+def _next_frame():
+    """Count a frame and stop the app once the frame limit is reached."""
+    global _frame_count, _frame_start, _idle_polls
+    if _frame_start is None:
+        _frame_start = time.perf_counter()
+    _frame_count += 1
+    _idle_polls = 0
+    if _frame_limit is not None and _frame_count >= _frame_limit:
+        elapsed = time.perf_counter() - _frame_start
+        print(f"gint: {_frame_count} frames in {elapsed:.3f}s "
+              f"({elapsed * 1000 / _frame_count:.3f} ms/frame)", file=sys.stderr)
+        pygame.quit()
+        sys.exit(0)
+
+def frame_count() -> int:
+    """Number of frames pushed by dupdate() since startup."""
+    return _frame_count
+
+def step_frames(n: int, draw=None) -> float:
+    """
+    Run n frames back to back: call draw(i) (if given) then dupdate().
+    Returns the wall time in seconds, which in headless mode is pure
+    render cost since no frame-rate sleep is involved.
+    """
+    t0 = time.perf_counter()
+    for i in range(n):
+        if draw is not None:
+            draw(i)
+        dupdate()
+    return time.perf_counter() - t0
+
+def init(backend: Optional[str] = None, frames: Optional[int] = None):
+    """
+    Configure the emulator backend.
+
+    Args:
+        backend: BACKEND_WINDOW or BACKEND_HEADLESS (None keeps the current one)
+        frames: exit after this many frames (0 disables the limit)
+    """
+    global _backend, screen, _frame_limit
+    if frames is not None:
+        _frame_limit = frames or None
+
+    if backend is None or backend == _backend:
+        return
+    if backend not in (BACKEND_WINDOW, BACKEND_HEADLESS):
+        raise ValueError(f"Unknown gint backend: {backend}")
+
+    # Restart the video subsystem on the right driver; VRAM is kept as-is
+    if _display_ready:
+        pygame.display.quit()
+    if backend == BACKEND_HEADLESS:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    elif _sdl_driver is not None:
+        os.environ["SDL_VIDEODRIVER"] = _sdl_driver
+    else:
+        os.environ.pop("SDL_VIDEODRIVER", None)
+    if not _display_ready:
+        _backend = backend   # the display is opened on first use
+        return
+    pygame.display.init()
+    pygame.event.set_allowed(_allowed_events)
+    _backend = backend
+
+    screen = None
+    if backend == BACKEND_WINDOW:
+        screen = pygame.display.set_mode((DWIDTH * SCALE, DHEIGHT * SCALE))
+        pygame.display.set_caption("ClassPad")
+        _damage_everything()
+    _setup_scaling()
 
 def dpixel(x: int, y: int, color: int):
     if color == C_NONE or not (0 <= x < DWIDTH and 0 <= y < DHEIGHT):
         return
     vram.set_at((x, y), _to_rgb(color))
+    _dirty_tiles[(y // DAMAGE_TILE) * _TILES_X + x // DAMAGE_TILE] = 1
 
 def dgetpixel(x: int, y: int) -> int:
     if not (0 <= x < DWIDTH and 0 <= y < DHEIGHT):
@@ -135,7 +447,7 @@ def drect(x1: int, y1: int, x2: int, y2: int, color: int):
     y = min(y1, y2)
     w = abs(x2 - x1) + 1
     h = abs(y2 - y1) + 1
-    pygame.draw.rect(vram, _to_rgb(color), pygame.Rect(x, y, w, h))
+    _damage(pygame.draw.rect(vram, _to_rgb(color), pygame.Rect(x, y, w, h)))
 
 def drect_border(x1: int, y1: int, x2: int, y2: int,
                fill: int, border_width: int, border: int):
@@ -147,12 +459,12 @@ def drect_border(x1: int, y1: int, x2: int, y2: int,
         y = min(y1, y2)
         w = abs(x2 - x1)
         h = abs(y2 - y1)
-        pygame.draw.rect(vram, _to_rgb(border), pygame.Rect(x, y, w, h), border_width)
+        _damage(pygame.draw.rect(vram, _to_rgb(border), pygame.Rect(x, y, w, h), border_width))
 
 def dline(x1: int, y1: int, x2: int, y2: int, color: int):
     if color == C_NONE:
         return
-    pygame.draw.line(vram, _to_rgb(color), (x1, y1), (x2, y2))
+    _damage(pygame.draw.line(vram, _to_rgb(color), (x1, y1), (x2, y2)))
 
 def dhline(y: int, color: int):
     dline(0, y, DWIDTH-1, y, color)
@@ -162,16 +474,16 @@ def dvline(x: int, color: int):
 
 def dcircle(x: int, y: int, r: int, fill: int, border: int):
     if fill != C_NONE:
-        pygame.draw.circle(vram, _to_rgb(fill), (x, y), r)
+        _damage(pygame.draw.circle(vram, _to_rgb(fill), (x, y), r))
     if border != C_NONE:
-        pygame.draw.circle(vram, _to_rgb(border), (x, y), r, 1)
+        _damage(pygame.draw.circle(vram, _to_rgb(border), (x, y), r, 1))
 
 def dellipse(x1: int, y1: int, x2: int, y2: int, fill: int, border: int):
     rect = pygame.Rect(min(x1, x2), min(y1, y2), abs(x2-x1), abs(y2-y1))
     if fill != C_NONE:
-        pygame.draw.ellipse(vram, _to_rgb(fill), rect)
+        _damage(pygame.draw.ellipse(vram, _to_rgb(fill), rect))
     if border != C_NONE:
-        pygame.draw.ellipse(vram, _to_rgb(border), rect, 1)
+        _damage(pygame.draw.ellipse(vram, _to_rgb(border), rect, 1))
 
 def dpoly(vertices: List[int], fill: int, border: int):
     """Draw polygon with fill and border"""
@@ -182,11 +494,138 @@ def dpoly(vertices: List[int], fill: int, border: int):
     
     # Draw filled polygon
     if fill != C_NONE:
-        pygame.draw.polygon(vram, _to_rgb(fill), points, 0)
+        _damage(pygame.draw.polygon(vram, _to_rgb(fill), points, 0))
     
     # Draw border
     if border != C_NONE:
-        pygame.draw.polygon(vram, _to_rgb(border), points, 1)
+        _damage(pygame.draw.polygon(vram, _to_rgb(border), points, 1))
+
+# ---------------------------------------------------------------------------
+
+# Batched primitives: one call for a whole flat sequence (list, array or
+# memoryview) of shapes, either all of one color or each followed by its own
+# color. The batch is damaged as a single rectangle (the union of what was
+# drawn), so keep batches local. These are emulator-only: apps should fall
+# back to the single primitives when they are missing on the calculator.
+
+# Batches of pixels past this size are written with numpy, when available
+_PIXEL_BATCH_NUMPY = 64
+
+def _batch_items(seq, stride: int, color: Optional[int]):
+    """Split a flat sequence into tuples of stride values, plus a color"""
+    if color is None:
+        stride += 1
+    if len(seq) % stride:
+        raise ValueError(f"Sequence length must be a multiple of {stride}")
+    columns = [seq[i::stride] for i in range(stride)]
+    if color is None:
+        return zip(*columns)
+    return zip(*columns, itertools.repeat(color))
+
+def _batch_rgb(color: int, lut=RGB565_TO_RGB888):
+    return lut[color] if 0 <= color <= 0xFFFF else _to_rgb(color)
+
+def _damage_batch(rects: list):
+    rects = [rect for rect in rects if rect]
+    if rects:
+        _damage(rects[0].unionall(rects))
+
+def drect_many(rects, color: Optional[int] = None):
+    """
+    Draw filled rectangles from a flat sequence of x1, y1, x2, y2 (all in
+    color), or of x1, y1, x2, y2, color when color is None.
+    """
+    rect = pygame.draw.rect
+    drawn = []
+    append = drawn.append
+    for x1, y1, x2, y2, c in _batch_items(rects, 4, color):
+        if c == C_NONE:
+            continue
+        if x1 > x2:
+            x1, x2 = x2, x1
+        if y1 > y2:
+            y1, y2 = y2, y1
+        append(rect(vram, _batch_rgb(c), (x1, y1, x2 - x1 + 1, y2 - y1 + 1)))
+    _damage_batch(drawn)
+
+def dline_many(lines, color: Optional[int] = None):
+    """
+    Draw line segments from a flat sequence of x1, y1, x2, y2 (all in
+    color), or of x1, y1, x2, y2, color when color is None.
+    """
+    line = pygame.draw.line
+    drawn = []
+    append = drawn.append
+    for x1, y1, x2, y2, c in _batch_items(lines, 4, color):
+        if c != C_NONE:
+            append(line(vram, _batch_rgb(c), (x1, y1), (x2, y2)))
+    _damage_batch(drawn)
+
+def dpixel_many(pixels, color: Optional[int] = None):
+    """
+    Set pixels from a flat sequence of x, y (all in color), or of x, y, color
+    when color is None. Pixels outside of VRAM are ignored.
+    """
+    stride = 2 if color is not None else 3
+    if color == C_NONE:
+        return
+    if _numpy is not None and len(pixels) >= _PIXEL_BATCH_NUMPY * stride:
+        _dpixel_many_numpy(pixels, stride, color)
+        return
+    set_at = vram.set_at
+    tiles = _dirty_tiles
+    for x, y, c in _batch_items(pixels, 2, color):
+        if c == C_NONE or not (0 <= x < DWIDTH and 0 <= y < DHEIGHT):
+            continue
+        set_at((x, y), _batch_rgb(c))
+        tiles[(y // DAMAGE_TILE) * _TILES_X + x // DAMAGE_TILE] = 1
+
+def _dpixel_many_numpy(pixels, stride: int, color: Optional[int]):
+    data = _numpy.asarray(pixels, dtype=_numpy.int64)
+    if len(data) % stride:
+        raise ValueError(f"Sequence length must be a multiple of {stride}")
+    data = data.reshape(-1, stride)
+    xs, ys = data[:, 0], data[:, 1]
+    clip = vram.get_clip()
+    keep = (xs >= clip.left) & (xs < clip.right) & (ys >= clip.top) & (ys < clip.bottom)
+    if color is None:
+        colors = data[:, 2]
+        keep &= colors != C_NONE
+        colors = colors[keep]
+    xs, ys = xs[keep], ys[keep]
+    if not len(xs):
+        return
+
+    if color is None:
+        # Map every distinct color once, in the surface's own pixel format
+        distinct, index = _numpy.unique(colors, return_inverse=True)
+        mapped = _numpy.array([vram.map_rgb(_batch_rgb(int(c))) for c in distinct],
+                              dtype=_numpy.uint32)[index]
+    else:
+        mapped = vram.map_rgb(_batch_rgb(color))
+    surface = pygame.surfarray.pixels2d(vram)
+    try:
+        surface[xs, ys] = mapped
+    finally:
+        del surface
+    _numpy.frombuffer(_dirty_tiles, _numpy.uint8)[
+        (ys // DAMAGE_TILE) * _TILES_X + xs // DAMAGE_TILE] = 1
+
+def dpoly_many(polygons, fill: int, border: int):
+    """Draw several polygons (each a flat x, y vertex sequence, as for dpoly())."""
+    polygon = pygame.draw.polygon
+    fill_rgb = _to_rgb(fill) if fill != C_NONE else None
+    border_rgb = _to_rgb(border) if border != C_NONE else None
+    drawn = []
+    for vertices in polygons:
+        if len(vertices) % 2 != 0:
+            raise ValueError("Vertices must contain even number of coordinates")
+        points = list(zip(vertices[0::2], vertices[1::2]))
+        if fill_rgb is not None:
+            drawn.append(polygon(vram, fill_rgb, points, 0))
+        if border_rgb is not None:
+            drawn.append(polygon(vram, border_rgb, points, 1))
+    _damage_batch(drawn)
 
 
 
@@ -222,17 +661,45 @@ _default_font = GintFont(  # Create a default font object
 )
 _current_font = _default_font
 
+def font(prop, line_height, data_height, block_count, glyph_count,
+         char_spacing, line_distance, blocks, data, width, storage_size,
+         glyph_index, glyph_width) -> GintFont:
+    """Font from topti data, as output by fxconv for PythonExtra."""
+    return GintFont(prop, line_height, data_height, block_count, glyph_count,
+                    char_spacing, line_distance, blocks, data, width,
+                    storage_size, glyph_index, glyph_width)
+
 def dfont(font: GintFont):
     global _current_font
     _current_font = font
 
 # ---------------------------------------------------------------------------
 
-# Load bitmap font
-_uf8x9_font = pygame.image.load("_data/font8x9.png").convert()
-# _uf8x9_font = pygame.image.load("_data/uf8x9.png").convert()
-_uf8x9_font.set_colorkey((255, 255, 255))  # Make white transparent
-_uf8x9_font = _uf8x9_font.convert_alpha()
+def _load_font_sheet(path: str) -> pygame.Surface:
+    """Load a font sheet with white made transparent."""
+    sheet = pygame.image.load(path)
+    if pygame.display.get_surface() is not None:
+        sheet = sheet.convert()
+        sheet.set_colorkey((255, 255, 255))  # Make white transparent
+        return sheet.convert_alpha()
+    sheet.set_colorkey((255, 255, 255))
+    # No display to convert against (headless): blitting through the
+    # colorkey into an alpha surface gives the same result
+    glyphs = pygame.Surface(sheet.get_size(), pygame.SRCALPHA)
+    glyphs.fill((0, 0, 0, 0))
+    glyphs.blit(sheet, (0, 0))
+    return glyphs
+
+# Bitmap font, loaded by the first glyph lookup
+_data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_data")
+_uf8x9_font = None
+
+def _font_sheet() -> pygame.Surface:
+    global _uf8x9_font
+    if _uf8x9_font is None:
+        _uf8x9_font = _load_font_sheet(os.path.join(_data_dir, "font8x9.png"))
+        # _uf8x9_font = _load_font_sheet(os.path.join(_data_dir, "uf8x9.png"))
+    return _uf8x9_font
 
 # Font character cache {unicode_code: (surface, width)}
 _font_cache = {}
@@ -254,26 +721,29 @@ LINE_DEFS = [
     (0x0070, 16)   # p to DEL
 ]
 
+# Grid cell of every code point in the sheet {unicode_code: (row, col)}
+_glyph_cells = {start + col: (row, col)
+                for row, (start, count) in enumerate(LINE_DEFS)
+                for col in range(count)}
+
 def _get_glyph(font: GintFont, char: str):
     """Get glyph surface and width with 1px gap grid layout"""
     code = ord(char)
+
+    if font.data:
+        return _font_atlas(font).glyph(code)
     
     if code in _font_cache:
         return _font_cache[code]
     
-    # Find which line the character is in
-    line_index = -1
-    for i, (start, count) in enumerate(LINE_DEFS):
-        if start <= code < start + count:
-            line_index = i
-            break
-    
-    if line_index == -1:
-        return _get_glyph(font, ' ')  # Fallback to space
+    cell = _glyph_cells.get(code)
+    if cell is None:
+        # Fallback to space (cached so unknown characters stay cheap)
+        _font_cache[code] = _get_glyph(font, ' ')
+        return _font_cache[code]
     
     # Calculate grid position
-    col = code - LINE_DEFS[line_index][0]
-    row = line_index
+    row, col = cell
     
     # Calculate coordinates in texture (with 1px gaps)
     x = (col * FONT_CELL_WIDTH) - GAP  # Compensate left offset
@@ -281,7 +751,7 @@ def _get_glyph(font: GintFont, char: str):
     
     try:
         # Extract glyph (8x9 area inside cell)
-        glyph = _uf8x9_font.subsurface(
+        glyph = _font_sheet().subsurface(
             x + GAP,  # Original GAP compensation
             y + GAP,   # Original GAP compensation
             GLYPH_WIDTH + GAP, 
@@ -301,18 +771,186 @@ def _get_glyph(font: GintFont, char: str):
     _font_cache[code] = (glyph, width)
     return glyph, width
 
+# ---------------------------------------------------------------------------
+
+# Topti fonts (converted by fxconv). The glyph bitmaps are decoded once into a
+# packed atlas: white glyphs on a transparent background, each with a
+# transparent column and row before it so that glyph cells line up with the
+# ones of the bundled sheet (blitted at -GAP). Recolored copies of the whole
+# atlas are kept per color, so a string is drawn with a single blits() call.
+
+ATLAS_WIDTH = 1024
+_ATLAS_COLORS = 8
+_BIT_ALPHA = bytes.maketrans(b'01', b'\x00\xff')
+
+class _FontAtlas:
+    """Decoded glyphs of a topti font {unicode_code: (cell rect, width)}"""
+    def __init__(self, font: GintFont):
+        height = font.data_height
+        prop = bool(font.prop & 1)
+        blocks = struct.unpack(f'>{len(font.blocks) // 4}I', font.blocks)
+        if prop:
+            index = struct.unpack(f'>{len(font.glyph_index) // 2}H', font.glyph_index)
+
+        # Shelf packing: glyphs left to right, a new shelf when the row is full
+        cells = []      # (code, width, bits)
+        x = y = 0
+        number = 0
+        offset = 0
+        for block in blocks:
+            start, length = block >> 12, block & 0xfff
+            for code in range(start, start + length):
+                if prop:
+                    if number % 8 == 0:
+                        offset = index[number // 8] * 4
+                    width = font.glyph_width[number]
+                    size = ((width * height + 31) >> 5) * 4
+                else:
+                    width = font.width
+                    size = font.storage_size * 4
+                bits = font.data[offset:offset + size]
+                offset += size
+                number += 1
+                if x + width + GAP > ATLAS_WIDTH:
+                    x, y = 0, y + height + GAP
+                cells.append((code, x + GAP, y + GAP, width, bits))
+                x += width + GAP
+        atlas_height = y + height + GAP
+
+        # One alpha byte per pixel, then white RGBA around it
+        alpha = bytearray(ATLAS_WIDTH * atlas_height)
+        self.glyphs = {}
+        self.max_width = 0
+        for code, gx, gy, width, bits in cells:
+            pixels = width * height
+            if pixels:
+                row_bits = format(int.from_bytes(bits, 'big'), f'0{len(bits) * 8}b')
+                rows = row_bits[:pixels].encode().translate(_BIT_ALPHA)
+                for row in range(height):
+                    start = (gy + row) * ATLAS_WIDTH + gx
+                    alpha[start:start + width] = rows[row * width:(row + 1) * width]
+            self.glyphs[code] = (pygame.Rect(gx - GAP, gy - GAP, width + GAP, height + GAP),
+                                 width)
+            self.max_width = max(self.max_width, width)
+
+        rgba = bytearray(b'\xff') * (len(alpha) * 4)
+        rgba[3::4] = alpha
+        self.surface = pygame.image.fromstring(bytes(rgba), (ATLAS_WIDTH, atlas_height),
+                                               'RGBA')
+        self.height = height
+        self.colors = collections.OrderedDict()
+
+    def glyph(self, code: int):
+        """Glyph cell surface and width, or None if the font has no such glyph"""
+        cell = self.glyphs.get(code)
+        if cell is None:
+            return None
+        rect, width = cell
+        return self.surface.subsurface(rect), width
+
+    def colored(self, rgb: tuple) -> pygame.Surface:
+        """The whole atlas recolored to rgb (a few colors are kept)"""
+        surface = self.colors.get(rgb)
+        if surface is None:
+            surface = self.surface.copy()
+            surface.fill(rgb + (255,), special_flags=pygame.BLEND_RGBA_MULT)
+            self.colors[rgb] = surface
+            if len(self.colors) > _ATLAS_COLORS:
+                self.colors.popitem(last=False)
+        else:
+            self.colors.move_to_end(rgb)
+        return surface
+
+_font_atlases = {}
+
+def _font_atlas(font: GintFont) -> Optional[_FontAtlas]:
+    """Atlas of a topti font, None for the bundled sheet font"""
+    if not font.data:
+        return None
+    atlas = _font_atlases.get(font)
+    if atlas is None:
+        atlas = _font_atlases[font] = _FontAtlas(font)
+    return atlas
+
+def _glyph_box(font: GintFont) -> Tuple[int, int]:
+    """Largest glyph width and the glyph height of a font"""
+    atlas = _font_atlas(font)
+    if atlas is None:
+        return GLYPH_WIDTH, GLYPH_HEIGHT
+    return atlas.max_width, atlas.height
+
+def _line_height(font: GintFont) -> int:
+    return GLYPH_HEIGHT if not font.data else font.line_height
+
+# ---------------------------------------------------------------------------
+
+# Text measurement. Glyph widths are precomputed into a byte array the first
+# time text is measured; per font, an "advance map" turns text into one character
+# per glyph whose code is the glyph width plus char_spacing, so measuring is
+# a str.translate() and a sum() over bytes, without any Python-level loop.
+
+_glyph_widths = None
+
+def _glyph_width_table() -> array.array:
+    global _glyph_widths
+    if _glyph_widths is None:
+        _glyph_widths = array.array('B', (_get_glyph(_default_font, chr(code))[1]
+                                          for code in range(max(_glyph_cells) + 1)))
+    return _glyph_widths
+
+class _AdvanceMap(dict):
+    """str.translate() table {unicode_code: chr(width + char_spacing)}"""
+    def __init__(self, font: GintFont):
+        super().__init__()
+        self.font = font
+        spacing = font.char_spacing
+        atlas = _font_atlas(font)
+        if atlas is not None:
+            for code, (_, width) in atlas.glyphs.items():
+                self[code] = chr(width + spacing)
+            return
+        for code, width in enumerate(_glyph_width_table()):
+            self[code] = chr(width + spacing)
+
+    def __missing__(self, code):
+        # Characters missing from a topti font are skipped, like on the device
+        if self.font.data:
+            return '\x00'
+        advance = chr(_get_glyph(self.font, chr(code))[1] + self.font.char_spacing)
+        self[code] = advance
+        return advance
+
+_advance_maps = {}
+
+def _advances(font: GintFont, text: str) -> bytes:
+    """Per-character advances (glyph width + char spacing) of text"""
+    table = _advance_maps.get(font)
+    if table is None:
+        table = _advance_maps[font] = _AdvanceMap(font)
+    return text.translate(table).encode('latin-1')
+
 def dsize(text: str, font: Optional[GintFont]) -> Tuple[int, int]:
     """Get the width and height of rendered text."""
-    if not text:
-        return 0, GLYPH_HEIGHT
-    
     font = font or _current_font
+    if not text:
+        return 0, _line_height(font)
     
-    widths = [_get_glyph(font, c)[1] for c in text]
     # Sum of glyph widths + spacing between them
-    total_width = sum(widths) + (len(text) - 1) * font.char_spacing
+    total_width = sum(_advances(font, text)) - font.char_spacing
     
-    return total_width, GLYPH_HEIGHT
+    return total_width, _line_height(font)
+
+def dsize_prefix(text: str, font: Optional[GintFont]) -> List[int]:
+    """
+    Get the x offset of every character of a rendered text.
+
+    Returns len(text) + 1 offsets: entry i is where character i starts, so
+    the width of text[:i] is offsets[i] - char_spacing (for i > 0). The list
+    is sorted, which lets wrapping and hit-testing use bisect instead of
+    measuring substrings.
+    """
+    font = font or _current_font
+    return list(itertools.accumulate(_advances(font, text), initial=0))
 
 def dnsize(text: str, size: int, font: Optional[GintFont]) -> Tuple[int, int]:
     """Get the width and height of a prefix of a rendered text."""
@@ -333,23 +971,201 @@ def drsize(text: str, font: Optional[GintFont], width: int) -> Tuple[int, int]:
         may fail. This is a known issue.
     """
     font = font or _current_font
-    byte_offset = 0
-    actual_width = 0
+    spacing = font.char_spacing
     
-    for i, char in enumerate(text):
-        glyph_w = _get_glyph(font, char)[1]
-        
-        # Width this character would occupy (including preceding space)
-        char_total_w = glyph_w + (font.char_spacing if i > 0 else 0)
-        
-        if actual_width + char_total_w > width:
-            break # Character does not fit, stop here.
-        
-        # It fits, commit the changes
-        actual_width += char_total_w
-        byte_offset += len(char.encode('utf-8'))
-        
-    return byte_offset, actual_width
+    # The first n characters fit if offsets[n] - spacing <= width
+    offsets = dsize_prefix(text, font)
+    count = max(0, bisect.bisect_right(offsets, width + spacing) - 1)
+    if count == 0:
+        return 0, 0
+    
+    byte_offset = len(text[:count].encode('utf-8'))
+    return byte_offset, offsets[count] - spacing
+
+
+# ---------------------------------------------------------------------------
+
+# Text caches: recolored glyphs keyed by (code point, color), and whole
+# rendered strings keyed by (text, fg, bg, font), both bounded LRUs
+
+class _SurfaceCache:
+    """Bounded LRU cache of surfaces with hit/miss counters."""
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.entries = collections.OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _sizeof(surface: pygame.Surface) -> int:
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def get(self, key):
+        surface = self.entries.get(key)
+        if surface is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return surface
+
+    def put(self, key, surface: pygame.Surface):
+        size = self._sizeof(surface)
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= self._sizeof(old)
+        self.entries[key] = surface
+        self.bytes += size
+        self._trim()
+
+    def _trim(self):
+        while self.entries and (len(self.entries) > self.max_entries
+                                or self.bytes > self.max_bytes):
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= self._sizeof(old)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+_glyph_cache = _SurfaceCache(max_entries=2048, max_bytes=1 << 20)
+_text_cache = _SurfaceCache(max_entries=512, max_bytes=2 << 20)
+_text_cache_enabled = True
+
+def dtext_cache_set(glyphs: Optional[int] = None, max_bytes: Optional[int] = None,
+                    strings: Optional[bool] = None, glyph_bytes: Optional[int] = None):
+    """
+    Configure the text caches. Together they never hold more than
+    max_bytes + glyph_bytes of surfaces (3 MB by default).
+
+    Args:
+        glyphs: maximum number of recolored glyphs kept
+        max_bytes: memory cap of the string cache, in bytes
+        strings: enable or disable the whole-string cache
+        glyph_bytes: memory cap of the glyph cache, in bytes
+    """
+    global _text_cache_enabled
+    if glyphs is not None:
+        _glyph_cache.max_entries = glyphs
+    if glyph_bytes is not None:
+        _glyph_cache.max_bytes = glyph_bytes
+    _glyph_cache._trim()
+    if max_bytes is not None:
+        _text_cache.max_bytes = max_bytes
+        _text_cache._trim()
+    if strings is not None:
+        _text_cache_enabled = strings
+        if not strings:
+            _text_cache.clear()
+
+def dtext_cache_stats() -> dict:
+    """Hit/miss counters and memory use of the text caches."""
+    return {
+        'glyph_hits': _glyph_cache.hits,
+        'glyph_misses': _glyph_cache.misses,
+        'glyph_entries': len(_glyph_cache.entries),
+        'glyph_bytes': _glyph_cache.bytes,
+        'text_hits': _text_cache.hits,
+        'text_misses': _text_cache.misses,
+        'text_entries': len(_text_cache.entries),
+        'text_bytes': _text_cache.bytes,
+    }
+
+def dtext_cache_clear():
+    """Drop every cached glyph and string surface (counters are kept)."""
+    _glyph_cache.clear()
+    _text_cache.clear()
+
+def _colored_glyph(font: GintFont, char: str, rgb: tuple):
+    """Get a glyph recolored to rgb (None if the font lacks it), and its width"""
+    atlas = _font_atlas(font)
+    if atlas is not None:
+        cell = atlas.glyphs.get(ord(char))
+        if cell is None:
+            return None, 0
+        rect, width = cell
+        return atlas.colored(rgb).subsurface(rect), width
+
+    glyph, width = _get_glyph(font, char)
+    key = (ord(char), rgb)
+    colored = _glyph_cache.get(key)
+    if colored is None:
+        mask = pygame.mask.from_surface(glyph)
+        colored = pygame.Surface(glyph.get_size(), pygame.SRCALPHA)
+        mask.to_surface(colored, setcolor=rgb, unsetcolor=(0,0,0,0))
+        _glyph_cache.put(key, colored)
+    return colored, width
+
+def _glyph_run(font: GintFont, text: str, rgb: tuple, x: int, y: int) -> list:
+    """blits() sequence drawing text with its first glyph cell at (x, y)"""
+    atlas = _font_atlas(font)
+    run = []
+    if atlas is not None:
+        # Every glyph is an area of the same recolored atlas
+        colored = atlas.colored(rgb)
+        glyphs = atlas.glyphs
+        for char, advance in zip(text, _advances(font, text)):
+            cell = glyphs.get(ord(char))
+            if cell is not None:
+                run.append((colored, (x, y), cell[0]))
+            x += advance
+        return run
+    for char in text:
+        colored, width = _colored_glyph(font, char, rgb)
+        run.append((colored, (x, y)))
+        x += width + font.char_spacing
+    return run
+
+def _render_text(font: GintFont, text: str, fg: int, bg: int,
+                 total_width: int, total_height: int) -> pygame.Surface:
+    """Render a whole string (and its background box) into one surface"""
+    # The surface origin is the top-left corner of the background box, at
+    # (x - 1, y - 1); glyph cells are offset by -GAP from the cursor too
+    run_width = sum(_advances(font, text[:-1]))
+    glyph_width, glyph_height = _glyph_box(font)
+    width = max(total_width + 2, run_width + glyph_width + GAP)
+    height = max(total_height + 2, glyph_height + GAP)
+
+    surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    surface.fill((0, 0, 0, 0))
+    if bg != C_NONE:
+        surface.fill(_to_rgb(bg), pygame.Rect(0, 0, total_width + 2, total_height + 2))
+
+    if fg != C_NONE:
+        surface.blits(_glyph_run(font, text, _to_rgb(fg), 1 - GAP, 1 - GAP),
+                      doreturn=False)
+    return surface
+
+def _draw_text(x: int, y: int, fg: int, bg: int, text: str, font: GintFont,
+               total_width: int, total_height: int):
+    """Draw already-aligned text at (x, y), through the string cache if enabled"""
+    if _text_cache_enabled:
+        key = (text, fg, bg, font)
+        surface = _text_cache.get(key)
+        if surface is None:
+            surface = _render_text(font, text, fg, bg, total_width, total_height)
+            _text_cache.put(key, surface)
+        _damage(vram.blit(surface, (x - 1, y - 1)))
+        return
+
+    # Draw background (if requested)
+    if bg != C_NONE:
+        bg_rect = pygame.Rect(
+            x - 1, y - 1,
+            total_width + 2, total_height + 2
+        )
+        _damage(pygame.draw.rect(vram, _to_rgb(bg), bg_rect))
+
+    if fg == C_NONE:
+        return
+
+    # Draw text characters
+    for rect in vram.blits(_glyph_run(font, text, _to_rgb(fg), x - GAP, y - GAP)):
+        _damage(rect)
 
 
 # Updated text rendering with precise spacing
@@ -361,9 +1177,6 @@ def dtext(x: int, y: int, color: int, text: str,
     font = _current_font or _default_font
     
     # Calculate total width and heights
-    # widths = [_get_glyph(font, c)[1] for c in text]
-    # total_width = sum(widths)
-    # total_height = GLYPH_HEIGHT
     total_width, total_height = dsize(text, font)
     
     # Horizontal alignment
@@ -378,18 +1191,7 @@ def dtext(x: int, y: int, color: int, text: str,
     elif valign == DTEXT_BOTTOM:
         y -= total_height
     
-    # Draw each character
-    cursor_x = x
-    for char in text:
-        glyph, width = _get_glyph(font, char)
-        
-        # Create colored glyph
-        mask = pygame.mask.from_surface(glyph)
-        colored = pygame.Surface(glyph.get_size(), pygame.SRCALPHA)
-        mask.to_surface(colored, setcolor=_to_rgb(color), unsetcolor=(0,0,0,0))
-        
-        vram.blit(colored, (cursor_x - GAP, y - GAP))
-        cursor_x += width + font.char_spacing
+    _draw_text(x, y, color, C_NONE, text, font, total_width, total_height)
 
 
 def dtext_opt(x: int, y: int, fg: int, bg: int, 
@@ -413,35 +1215,15 @@ def dtext_opt(x: int, y: int, fg: int, bg: int,
     elif valign == DTEXT_BOTTOM:
         y -= total_height
     
-    
-    # Draw background (if requested)
-    if bg != C_NONE:
-        bg_rect = pygame.Rect(
-            x - 1, y - 1,
-            total_width + 2, total_height + 2
-        )
-        pygame.draw.rect(vram, _to_rgb(bg), bg_rect)
-    
-    # Draw text characters
-    cursor_x = x
-    for char in text:
-        glyph, width = _get_glyph(font, char)
-        
-        # Create colored glyph
-        mask = pygame.mask.from_surface(glyph)
-        colored = pygame.Surface(glyph.get_size(), pygame.SRCALPHA)
-        mask.to_surface(colored, setcolor=_to_rgb(fg), unsetcolor=(0,0,0,0))
-        
-        vram.blit(colored, (cursor_x - GAP, y - GAP))
-        cursor_x += width + font.char_spacing
+    _draw_text(x, y, fg, bg, text, font, total_width, total_height)
 
 # Key Events
 
-pygame.event.set_allowed([
+_allowed_events = [
     QUIT, KEYDOWN, KEYUP,
     ACTIVEEVENT, VIDEORESIZE, VIDEOEXPOSE,
     MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION
-])
+]
 
 # Key constants
 KEY_F1		= 0x91
@@ -626,8 +1408,6 @@ class KeyEvent(_Event):
     def __init__(self, event_type=KEYEV_NONE, key=None, pos=(0, 0)):
         super().__init__(event_type, key)
 
-        mods = pygame.key.get_mods()
-
         self.time = int(time.monotonic() * 1000)
         self.mod = False
         self.shift = _modifiers['shift']
@@ -676,56 +1456,187 @@ _inverse_key_mapping.update({
 })
 
 
-def pollevent():
-    global _key_states
+# Event queue. Each poll drains pygame completely into a ring buffer and
+# events are then handed out one by one, so fast touch drags or key bursts
+# arriving in the same batch are not lost. Scripted events (inject_event(),
+# inject_script() or GINT_INPUT=<file>) are merged in when their frame comes.
+
+EVENT_QUEUE_SIZE = 1024
+
+_event_queue = collections.deque(maxlen=EVENT_QUEUE_SIZE)
+_event_stats = {'polled': 0, 'dropped': 0, 'injected': 0}
+_scripted_events = collections.deque()   # sorted (frame, seq, KeyEvent)
+_scripted_seq = 0
+_injected_keys: Set[int] = set()         # keys held down by injected events
+
+def _translate_event(event) -> Optional[KeyEvent]:
+    """Convert a pygame event to a KeyEvent (None if it has no gint equivalent)"""
+    if event.type == QUIT:
+        return KeyEvent(KEYEV_DOWN, KEY_EXIT)
+
+    elif event.type == VIDEOEXPOSE:  # <-- Triggered when window needs redraw
+        _present(full=True)
+
+    elif event.type == ACTIVEEVENT:
+        # Redraw when window gains focus (optional)
+        if event.gain == 1:  # 1 = window activated
+            _present(full=True)
+
+    # Handle mouse events as touch input
+    elif event.type == MOUSEBUTTONDOWN:
+        return KeyEvent(KEYEV_TOUCH_DOWN, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
+
+    elif event.type == MOUSEBUTTONUP:
+        return KeyEvent(KEYEV_TOUCH_UP, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
+
+    elif event.type == MOUSEMOTION:
+        if event.buttons[0]:  # Left mouse button dragged
+            return KeyEvent(KEYEV_TOUCH_DRAG, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
+
+    elif event.type == KEYDOWN:
+        # Capture Print Screen key to save VRAM (Shift: start/stop a capture)
+        if event.key == pygame.K_PRINTSCREEN:
+            if event.mod & KMOD_SHIFT:
+                if _capture is None:
+                    capture_start("capture.png")
+                else:
+                    capture_stop()
+                return None
+            pygame.image.save(vram, "screenshot.png")
+            print("screenshot !!")
+            return None
+
+        if event.key in _key_mapping:
+            mapped = _key_mapping[event.key]
+            _key_states[mapped] = {
+                'time': pygame.time.get_ticks(),
+                'last_repeat': pygame.time.get_ticks()
+            }
+            return KeyEvent(KEYEV_DOWN, mapped)
+
+    elif event.type == KEYUP:
+        if event.key in _key_mapping:
+            mapped = _key_mapping[event.key]
+            if mapped in _key_states:
+                del _key_states[mapped]
+            return KeyEvent(KEYEV_UP, mapped)
+
+    return None
+
+def _queue_event(ev: KeyEvent):
+    if ev.type == KEYEV_DOWN:
+        _state_queue.add(ev.key)
+        _state_flips.add(ev.key)
+    elif ev.type == KEYEV_UP:
+        _state_queue.discard(ev.key)
+        _state_flips.add(ev.key)
+    if len(_event_queue) == EVENT_QUEUE_SIZE:
+        _event_stats['dropped'] += 1
+    _event_queue.append(ev)
+
+def _fill_event_queue():
+    """Move due scripted events and all pending pygame events to the queue"""
+    _ensure_display()
     _update_modifiers()
-    
+    while _scripted_events and _scripted_events[0][0] <= _frame_count:
+        ev = _scripted_events.popleft()[2]
+        if ev.type == KEYEV_DOWN:
+            _injected_keys.add(ev.key)
+        elif ev.type == KEYEV_UP:
+            _injected_keys.discard(ev.key)
+        ev.time = int(time.monotonic() * 1000)
+        _queue_event(ev)
     for event in pygame.event.get():
-        if event.type == QUIT:
-            return KeyEvent(KEYEV_DOWN, KEY_EXIT)
-        
-        elif event.type == VIDEOEXPOSE:  # <-- Triggered when window needs redraw
-            dupdate()
+        ev = _translate_event(event)
+        if ev is not None:
+            _queue_event(ev)
 
-        elif event.type == ACTIVEEVENT:
-            # Redraw when window gains focus (optional)
-            if event.gain == 1:  # 1 = window activated
-                dupdate()
-        
-        # Handle mouse events as touch input
-        elif event.type == MOUSEBUTTONDOWN:
-            return KeyEvent(KEYEV_TOUCH_DOWN, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
-            
-        elif event.type == MOUSEBUTTONUP:
-            return KeyEvent(KEYEV_TOUCH_UP, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
-            
-        elif event.type == MOUSEMOTION:
-            if event.buttons[0]:  # Left mouse button dragged
-                return KeyEvent(KEYEV_TOUCH_DRAG, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
-            
-        elif event.type == KEYDOWN:
-            # Capture Print Screen key to save VRAM
-            if event.key == pygame.K_PRINTSCREEN:  # <-- Add this block
-                pygame.image.save(vram, "screenshot.png")
-                print("screenshot !!")
-                continue  # Skip further processing for this event
-                
-            if event.key in _key_mapping:
-                mapped = _key_mapping[event.key]
-                _key_states[mapped] = {
-                    'time': pygame.time.get_ticks(),
-                    'last_repeat': pygame.time.get_ticks()
-                }
-                return KeyEvent(KEYEV_DOWN, mapped)
-                
-        elif event.type == KEYUP:
-            if event.key in _key_mapping:
-                mapped = _key_mapping[event.key]
-                if mapped in _key_states:
-                    del _key_states[mapped]
-                return KeyEvent(KEYEV_UP, mapped)
-    
-    return KeyEvent(KEYEV_NONE, None)
+def _idle_poll():
+    """
+    Headless: an app that polls again without drawing in between (it only
+    redraws on input) has spent a frame idle, so count it. Otherwise such
+    apps would never reach GINT_FRAMES nor get their scripted events.
+    """
+    global _idle_polls
+    if screen is None:
+        _idle_polls += 1
+        if _idle_polls > 1:
+            _next_frame()
+
+def pollevent():
+    if not _event_queue:
+        _fill_event_queue()
+        if not _event_queue:
+            _idle_poll()
+            return KeyEvent(KEYEV_NONE, None)
+    _event_stats['polled'] += 1
+    return _event_queue.popleft()
+
+def pollevents() -> List[KeyEvent]:
+    """Return all pending events at once (oldest first), emptying the queue."""
+    _fill_event_queue()
+    if not _event_queue:
+        _idle_poll()
+    events = list(_event_queue)
+    _event_queue.clear()
+    _event_stats['polled'] += len(events)
+    return events
+
+def event_stats() -> dict:
+    """Counters of the event queue: events polled, dropped on overflow, injected."""
+    return dict(_event_stats, queued=len(_event_queue),
+                scripted=len(_scripted_events))
+
+def inject_event(type: int, key: Optional[int] = None, pos: Tuple[int, int] = (0, 0),
+                 frame: Optional[int] = None):
+    """
+    Schedule a synthetic event, delivered by pollevent() once frame_count()
+    reaches frame (default: right away). Injected KEYEV_DOWN/KEYEV_UP also
+    drive keydown() and friends, so polling apps can be scripted too.
+    """
+    global _scripted_seq
+    if frame is None:
+        frame = _frame_count
+    _scripted_seq += 1
+    bisect.insort(_scripted_events, (frame, _scripted_seq, KeyEvent(type, key, pos)))
+    _event_stats['injected'] += 1
+
+_SCRIPT_EVENTS = {
+    'down': KEYEV_DOWN, 'up': KEYEV_UP, 'hold': KEYEV_HOLD,
+    'touch_down': KEYEV_TOUCH_DOWN, 'touch_up': KEYEV_TOUCH_UP,
+    'touch_drag': KEYEV_TOUCH_DRAG,
+}
+
+def inject_script(path: str, offset: Optional[int] = None):
+    """
+    Schedule the events of an input script. One event per line, frame numbers
+    are relative to offset (default: the current frame):
+
+        # frame  event       key or x y
+        10       down        EXE
+        12       up          EXE
+        30       touch_down  120 200
+        31       touch_drag  124 204
+        32       touch_up    124 204
+    """
+    if offset is None:
+        offset = _frame_count
+    g = globals()
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            try:
+                frame, kind = int(fields[0]), _SCRIPT_EVENTS[fields[1].lower()]
+                if kind >= KEYEV_TOUCH_DOWN:
+                    inject_event(kind, None, (int(fields[2]), int(fields[3])), offset + frame)
+                else:
+                    name = fields[2].upper()
+                    key = g[name if name.startswith('KEY_') else 'KEY_' + name]
+                    inject_event(kind, key, frame=offset + frame)
+            except (ValueError, KeyError, IndexError):
+                raise ValueError(f"{path}:{lineno}: invalid input event: {line.strip()!r}")
 
 def keypressed(key: int) -> bool:
     """
@@ -746,6 +1657,7 @@ def getkey() -> KeyEvent:
     return getkey_opt(GETKEY_DEFAULT, None)
 
 def getkey_opt(options: int, timeout_ms: Optional[int] = 2000) -> KeyEvent:
+    _ensure_display()
     start_time = pygame.time.get_ticks()
     
     while True:
@@ -770,32 +1682,39 @@ def getkey_opt(options: int, timeout_ms: Optional[int] = 2000) -> KeyEvent:
                     _key_states[key]['last_repeat'] = current_time
                     return KeyEvent(KEYEV_HOLD, key)
         
-        # Prevent CPU hogging
-        pygame.time.wait(10)
+        # Prevent CPU hogging; headless runs spend the wait as an idle frame
+        if screen is None:
+            _next_frame()
+        else:
+            pygame.time.wait(10)
 
 def keydown(key: int) -> bool:
     """Check if a specific key is currently pressed"""
+    _ensure_display()
     pressed = pygame.key.get_pressed()
     if pygame.K_PRINTSCREEN in pressed:
         pygame.image.save(vram, "screenshot.png")
         print("screenshot !!")
-    return any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, []))
+    return key in _injected_keys or any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, []))
 
 def keydown_all(*keys: int) -> bool:
     """Check if all specified keys are pressed"""
+    _ensure_display()
     pressed = pygame.key.get_pressed()
-    return all(any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, [])) 
+    return all(key in _injected_keys or any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, []))
                 for key in keys)
 
 def keydown_any(*keys: int) -> bool:
     """Check if any of specified keys are pressed"""
+    _ensure_display()
     pressed = pygame.key.get_pressed()
-    return any(any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, [])) 
+    return any(key in _injected_keys or any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, []))
                for key in keys)
 
 def clearevents():
     """Clear all pending events from the queue"""
-    pygame.event.clear()
+    _fill_event_queue()
+    _event_queue.clear()
 
 def cleareventflips():
     global _key_states
@@ -803,6 +1722,7 @@ def cleareventflips():
     
     _key_states = {}
     _modifiers = {'shift': False, 'alpha': False}
+    _state_flips.clear()
 
 # -----------------------------------------------------------
 # Image stuff
@@ -829,131 +1749,134 @@ class Image:
         self.surface = self._decode_image()
 
     def _decode_image(self) -> pygame.Surface:
-        surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        pixels = pygame.PixelArray(surface)
-        
-        if self.profile == IMAGE_MONO:
-            # 1‑bpp: bit 0 = black, bit 1 = white
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    byte = self.data[row + (x >> 3)]
-                    bit  = (byte >> (7 - (x & 7))) & 1
-                    pixels[x, y] = (255,255,255) if bit else (0,0,0)
-        
-        elif self.profile == IMAGE_RGB565:
-            # Decode 16bpp direct color
-            for y in range(self.height):
-                for x in range(self.width):
-                    px_idx = (y * self.width + x) * 2
-                    rgb565 = struct.unpack('>H', self.data[px_idx:px_idx+2])[0]
-                    r = (rgb565 >> 11) * 255 // 31
-                    g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                    b = (rgb565 & 0x1F) * 255 // 31
-                    pixels[x, y] = (r, g, b)
-        
-        elif self.profile == IMAGE_RGB565A:
-            # 16‑bpp with 1-bit alpha
-            ALPHA_VAL = 0x0001   # as in fxconv’s CgProfile
-            for y in range(self.height):
-                for x in range(self.width):
-                    off = y * self.stride + x*2
-                    c = struct.unpack('>H', self.data[off:off+2])[0]
-                    if c == ALPHA_VAL:
-                        # leave pixel transparent
-                        continue
-                    # if c collided with alpha value, fxconv flips its low‑bit
-                    # but you can ignore that here
-                    r = (c >> 11) * 255 // 31
-                    g = ((c >> 5) & 0x3F) * 255 // 63
-                    b = (c & 0x1F) * 255 // 31
-                    pixels[x, y] = (r, g, b, 255)
-        
-        elif self.profile in (IMAGE_P8_RGB565, IMAGE_P8_RGB565A):
-            # 8‑bpp indexed
-            PALETTE_BASE = 0x80  # for RGB565; 0x81 if you’re using the ‘a’ profile
-            ALPHA_IDX    = 0x80  # only for IMAGE_P8_RGB565A
-            # build 256‑entry palette from your 2‑byte‑per‑entry self.palette
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    c = self.data[row + x]
-                    if self.profile == IMAGE_P8_RGB565A and c == ALPHA_IDX:
-                        continue
-                    idx = c - PALETTE_BASE
-                    pixels[x, y] = palette[idx]
-
-        elif self.profile in (IMAGE_P4_RGB565, IMAGE_P4_RGB565A):
-            # 4‑bpp indexed: two pixels per byte
-            PALETTE_BASE = 0     # for non‑alpha; 1 for the ‘a’ profile
-            ALPHA_IDX    = 0     # only for IMAGE_P4_RGB565A
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    byte = self.data[row + (x >> 1)]
-                    # even pixel in high nibble, odd in low
-                    nibble = (byte >> 4) if (x & 1)==0 else (byte & 0xF)
-                    if self.profile == IMAGE_P4_RGB565A and nibble == ALPHA_IDX:
-                        continue
-                    idx = nibble - PALETTE_BASE
-                    pixels[x, y] = palette[idx]
-
-        elif self.profile == IMAGE_P4_RGB565:
-            # Decode 4bpp palette-based image
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-            
-            for y in range(self.height):
-                for x in range(self.width):
-                    byte_idx = y * self.stride + (x // 2)
-                    byte = self.data[byte_idx]
-                    nibble = (byte >> 4) if x % 2 == 0 else (byte & 0x0F)
-                    
-                    pixels[x, y] = palette[nibble]
-
-        
-        
-        elif self.profile == IMAGE_P8_RGB565:
-            # 8‑bit palette‑based image -----------------------------------------
-            # The converter stores indices that start at 0x80 (palette_base)      # ←
-            # so we must subtract that offset before looking them up.             #
-            PALETTE_BASE = 0x80                                                   # |
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    idx = self.data[row + x] - PALETTE_BASE
-                    pixels[x, y] = palette[idx]
-        
-        pixels.close()
+        key = (self.profile, self.width, self.height, self.stride,
+               hashlib.sha1(self.data).digest(),
+               hashlib.sha1(self.palette).digest())
+        surface = _image_cache.get(key)
+        if surface is None:
+            surface = _decode_bulk(self.profile, self.width, self.height,
+                                   self.stride, self.data, self.palette)
+            _image_cache.put(key, surface)
         return surface
 
+# ---------------------------------------------------------------------------
+
+# Bulk image decoding. Each profile is described by a table that maps one
+# storage unit (a 16-bit word or a byte) to the RGBA bytes of the pixel(s) it
+# holds; a whole buffer is then expanded with one join() (or one NumPy fancy
+# index) and handed to pygame. Decoded surfaces are cached by content hash,
+# so identical image data is only decoded once per process.
+
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+_image_cache = _SurfaceCache(max_entries=256, max_bytes=32 << 20)
+_rgba565_tables = {}
+
+_TRANSPARENT = bytes(4)
+
+def _rgba565_table(alpha: bool) -> list:
+    """RGB565 word -> RGBA pixel; with alpha, 0x0001 is transparent (as in fxconv)"""
+    table = _rgba565_tables.get(alpha)
+    if table is None:
+        table = _rgba565_tables.get(False)
+        if table is None:
+            table = [bytes((r, g, b, 255)) for r, g, b in RGB565_TO_RGB888]
+            _rgba565_tables[False] = table
+        if alpha:
+            table = list(table)
+            table[0x0001] = _TRANSPARENT
+            _rgba565_tables[True] = table
+    return table
+
+def _palette_table(palette: bytes, count: int, base: int, alpha_idx: Optional[int]) -> list:
+    """Index -> RGBA pixel for indices 0..count-1 of a big-endian RGB565 palette"""
+    colors = [RGB565_TO_RGB888[c] for c in struct.unpack(f'>{len(palette) // 2}H',
+                                                        palette[:len(palette) // 2 * 2])]
+    table = []
+    for c in range(count):
+        if c == alpha_idx:
+            table.append(_TRANSPARENT)
+            continue
+        try:
+            r, g, b = colors[c - base]
+        except IndexError:
+            r, g, b = 0, 0, 0
+        table.append(bytes((r, g, b, 255)))
+    return table
+
+def _numpy_table(table: list):
+    """NumPy version of a unit table, one row of bytes per unit"""
+    return _numpy.frombuffer(b''.join(table), _numpy.uint8).reshape(len(table), -1)
+
+def _rgba565_numpy_table(alpha: bool):
+    key = ('numpy', alpha)
+    np_table = _rgba565_tables.get(key)
+    if np_table is None:
+        np_table = _rgba565_tables[key] = _numpy_table(_rgba565_table(alpha))
+    return np_table
+
+def _expand(units, table: list, numpy_units=None, np_table=None) -> bytes:
+    """Map every unit through table and concatenate the results"""
+    if _numpy is not None and numpy_units is not None:
+        if np_table is None:
+            np_table = _numpy_table(table)
+        return np_table[numpy_units].tobytes()
+    return b''.join(map(table.__getitem__, units))
+
+def _decode_bulk(profile: int, width: int, height: int, stride: int,
+                 data: bytes, palette: bytes) -> pygame.Surface:
+    """Decode a gint image into a 32-bit RGBA surface"""
+    size = stride * height
+    np_table = None
+    data = bytes(data[:size])
+    if len(data) < size:
+        data += bytes(size - len(data))
+
+    if profile in (IMAGE_RGB565, IMAGE_RGB565A):
+        # 16-bit big-endian words
+        table = _rgba565_table(profile == IMAGE_RGB565A)
+        units = array.array('H', data)
+        if sys.byteorder == 'little':
+            units.byteswap()
+        np_units = _numpy.frombuffer(data, '>u2') if _numpy is not None else None
+        np_table = _rgba565_numpy_table(profile == IMAGE_RGB565A) if _numpy is not None else None
+        row_pixels = stride // 2
+
+    elif profile in (IMAGE_P8_RGB565, IMAGE_P8_RGB565A):
+        # 8-bit indices, palette starts at 0x80
+        alpha_idx = 0x80 if profile == IMAGE_P8_RGB565A else None
+        table = _palette_table(palette, 256, 0x80, alpha_idx)
+        units = data
+        np_units = _numpy.frombuffer(data, _numpy.uint8) if _numpy is not None else None
+        row_pixels = stride
+
+    elif profile in (IMAGE_P4_RGB565, IMAGE_P4_RGB565A):
+        # 4-bit indices: even pixel in high nibble, odd in low
+        alpha_idx = 0 if profile == IMAGE_P4_RGB565A else None
+        nibbles = _palette_table(palette, 16, 0, alpha_idx)
+        table = [nibbles[b >> 4] + nibbles[b & 0xF] for b in range(256)]
+        units = data
+        np_units = _numpy.frombuffer(data, _numpy.uint8) if _numpy is not None else None
+        row_pixels = stride * 2
+
+    else:
+        # 1-bpp: bit 0 = black, bit 1 = white, MSB first
+        black, white = bytes((0, 0, 0, 255)), bytes((255, 255, 255, 255))
+        table = [b''.join(white if (b >> (7 - i)) & 1 else black for i in range(8))
+                 for b in range(256)]
+        units = data
+        np_units = _numpy.frombuffer(data, _numpy.uint8) if _numpy is not None else None
+        row_pixels = stride * 8
+
+    rgba = _expand(units, table, np_units, np_table)
+    surface = pygame.image.fromstring(rgba, (row_pixels, height), 'RGBA')
+    if row_pixels != width:
+        surface = surface.subsurface((0, 0, width, height)).copy()
+    return surface
+
 def image(profile: int, color_count: int, width: int, height: int, 
                 stride: int, data: bytearray, palette: bytearray) -> Image:
     return Image(IMAGE_RGB565, profile, color_count, width, height, stride, data, palette)
@@ -1061,14 +1984,1259 @@ def image_p4_rgb565a(width: int, height: int, data: bytes, palette: bytes) -> Im
 
 def dimage(x: int, y: int, img: Image):
     """Draw entire image at specified coordinates"""
-    vram.blit(img.surface, (x, y))
+    _damage(vram.blit(img.surface, (x, y)))
 
 def dsubimage(x: int, y: int, img: Image,
              left: int, top: int, width: int, height: int):
     """Draw subregion of image"""
     sub_rect = pygame.Rect(left, top, width, height)
     sub_surf = img.surface.subsurface(sub_rect)
-    vram.blit(sub_surf, (x, y))
+    _damage(vram.blit(sub_surf, (x, y)))
+
+def dsubimage_rgb565(x: int, y: int, data, stride: int,
+                     left: int, top: int, width: int, height: int,
+                     scale: int = 1, byteorder: str = 'big'):
+    """
+    Draw a sub-rectangle of a raw RGB565 buffer, scaled by an integer factor.
+
+    data is a bytes/bytearray/memoryview of rows of `stride` bytes. The
+    (left, top, width, height) region, in buffer pixels, is drawn at (x, y)
+    with every pixel covering scale x scale VRAM pixels. byteorder is the
+    layout of the 16-bit pixels ('big' like gint images, or 'little').
+
+    On device, the same region can be drawn (unscaled) by wrapping the
+    buffer with image_rgb565() and calling dsubimage().
+    """
+    if width <= 0 or height <= 0 or scale < 1:
+        return
+    if byteorder not in ('big', 'little'):
+        raise ValueError("byteorder must be 'big' or 'little'")
+
+    mv = memoryview(data).cast('B')
+    row_bytes = width * 2
+    if left < 0 or top < 0 or left * 2 + row_bytes > stride:
+        raise ValueError("Region wider than the RGB565 buffer rows")
+    if (top + height) * stride > len(mv):
+        raise ValueError("Region below the end of the RGB565 buffer")
+    start = top * stride + left * 2
+    if stride == row_bytes:
+        pixels = mv[start:start + row_bytes * height]
+    else:
+        pixels = b''.join([mv[row:row + row_bytes]
+                           for row in range(start, start + stride * height, stride)])
+
+    # Expand to RGBX through the shared RGB565 table, no per-pixel Python
+    if _numpy is not None:
+        words = _numpy.frombuffer(pixels, '>u2' if byteorder == 'big' else '<u2')
+        rgbx = _expand(None, None, words, _rgba565_numpy_table(False))
+    else:
+        words = array.array('H')
+        words.frombytes(pixels)
+        if byteorder != sys.byteorder:
+            words.byteswap()
+        rgbx = _expand(words, _rgba565_table(False))
+
+    surface = pygame.image.fromstring(rgbx, (width, height), 'RGBX')
+    if scale > 1:
+        surface = pygame.transform.scale(surface, (width * scale, height * scale))
+    _damage(vram.blit(surface, (x, y)))
+
+# ---------------------------------------------------------------------------
+
+# Instrumentation. While the profiler or the draw-call recorder is active,
+# public primitives are replaced in this module by wrappers; nested calls (like
+# dtext() calling dsize()) are only seen through the outermost primitive.
+#
+# Both can be enabled from the environment (see the end of this file) or by
+# calling profile_enable() / record_start() before the app does
+# `from gint import *`, since names bound by that import are not rewrapped.
+
+_INSTRUMENTED = (
+    'dclear', 'dupdate', 'dpixel', 'dgetpixel', 'drect', 'drect_border',
+    'dline', 'dhline', 'dvline', 'dcircle', 'dellipse', 'dpoly',
+    'drect_many', 'dline_many', 'dpixel_many', 'dpoly_many',
+    'dtext', 'dtext_opt', 'dsize', 'dnsize', 'drsize', 'dsize_prefix',
+    'dimage', 'dsubimage', 'dsubimage_rgb565', 'dwindow_set', 'dfont',
+    'image', 'image_rgb565', 'image_rgb565a', 'image_p8_rgb565',
+    'image_p8_rgb565a', 'image_p4_rgb565', 'image_p4_rgb565a',
+    'pollevent', 'pollevents', 'getkey', 'getkey_opt', 'keydown', 'keydown_all',
+    'keydown_any', 'clearevents', 'cleareventflips',
+)
+
+_primitives = {}             # name -> original function
+_instrument_depth = 0
+
+def _instrumented(name: str, fn):
+    """Wrap fn so that its outermost calls are recorded and timed"""
+    perf_counter = time.perf_counter
+    recorded = name in _RECORDED
+
+    def wrapper(*args, **kwargs):
+        global _instrument_depth, _profile_nested
+        if _instrument_depth:
+            return fn(*args, **kwargs)
+        if recorded and _recorder is not None:
+            _recorder.call(name, args, kwargs)
+        if _cost_enabled:
+            _cost_primitive(name, args, kwargs)
+        if _heap_enabled:
+            _heap_check()
+            traced = tracemalloc.get_traced_memory()[0]
+        _instrument_depth = 1
+        t0 = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - t0
+            _instrument_depth = 0
+            if _heap_enabled:
+                _heap_internal(traced)
+            if _profile_enabled:
+                # Time already counted under another name (capture) during the call
+                elapsed -= _profile_nested
+                _profile_nested = 0.0
+                entry = _profile_current.get(name)
+                if entry is None:
+                    _profile_current[name] = [1, elapsed]
+                else:
+                    entry[0] += 1
+                    entry[1] += elapsed
+                if name == 'dupdate':
+                    _profile_end_frame()
+            if _cost_enabled and name == 'dupdate':
+                _cost_end_frame()
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = fn.__doc__
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+def _instrument():
+    """Install the wrappers if any instrumentation is active, else remove them"""
+    g = globals()
+    if not _primitives:
+        _primitives.update((name, g[name]) for name in _INSTRUMENTED)
+    active = _profile_enabled or _recorder is not None or _cost_enabled or _heap_enabled
+    for name, fn in _primitives.items():
+        if not active:
+            g[name] = fn
+        elif getattr(g[name], '__wrapped__', None) is not fn:
+            g[name] = _instrumented(name, fn)
+
+# ---------------------------------------------------------------------------
+
+# Profiler: counts calls and accumulates wall time per primitive and per
+# frame. The last frames are kept in a ring buffer for the HUD and for export.
+# GINT_PROFILE=<file.json|file.csv|1> (written or printed at exit) and
+# GINT_PROFILE_HUD=1 enable it at startup.
+
+_profile_enabled = False
+_profile_hud = False
+_profile_frames = collections.deque(maxlen=120)
+_profile_current = {}        # name -> [calls, seconds] for the frame in progress
+_profile_nested = 0.0        # seconds of the current call profiled under another name
+_profile_frame_start = None
+
+def _profile_end_frame():
+    global _profile_current, _profile_frame_start
+    now = time.perf_counter()
+    if _profile_frame_start is not None:
+        _profile_frames.append((_frame_count, now - _profile_frame_start,
+                                _profile_current))
+    _profile_current = {}
+    _profile_frame_start = now
+
+def profile_enable(enabled: bool = True, frames: Optional[int] = None,
+                   hud: Optional[bool] = None):
+    """
+    Turn the per-primitive profiler on or off.
+
+    Args:
+        enabled: install or remove the instrumentation
+        frames: size of the ring buffer of recorded frames
+        hud: show ms/frame and the top primitives over the window
+    """
+    global _profile_enabled, _profile_frames, _profile_hud, _profile_frame_start
+    if frames is not None:
+        _profile_frames = collections.deque(_profile_frames, maxlen=frames)
+    if hud is not None:
+        _profile_hud = hud
+        _damage_everything()
+
+    if enabled == _profile_enabled:
+        return
+    _profile_enabled = enabled
+    _profile_frame_start = time.perf_counter() if enabled else None
+    _instrument()
+
+def profile_reset():
+    """Forget all recorded frames."""
+    global _profile_current
+    _profile_frames.clear()
+    _profile_current = {}
+
+def profile_frames() -> List[dict]:
+    """
+    Recorded frames, oldest first, as dicts:
+    {'frame': n, 'ms': wall time, 'calls': {name: {'count': c, 'ms': t}}}
+    """
+    return [{'frame': frame, 'ms': seconds * 1000,
+             'calls': {name: {'count': count, 'ms': t * 1000}
+                       for name, (count, t) in calls.items()}}
+            for frame, seconds, calls in _profile_frames]
+
+def profile_summary() -> dict:
+    """Per-primitive totals over the recorded frames, plus average ms/frame."""
+    frames = len(_profile_frames)
+    totals = {}
+    for _, _, calls in _profile_frames:
+        for name, (count, t) in calls.items():
+            total = totals.setdefault(name, [0, 0.0])
+            total[0] += count
+            total[1] += t
+    wall = sum(seconds for _, seconds, _ in _profile_frames)
+    return {
+        'frames': frames,
+        'ms_per_frame': wall * 1000 / frames if frames else 0.0,
+        'primitives': {name: {'count': count, 'ms': t * 1000,
+                              'ms_per_frame': t * 1000 / frames}
+                       for name, (count, t) in sorted(totals.items(),
+                                                      key=lambda kv: -kv[1][1])},
+    }
+
+def profile_export(path: str):
+    """Write the recorded frames to a .json (frames + summary) or .csv file."""
+    if path.lower().endswith('.csv'):
+        import csv
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'frame_ms', 'primitive', 'count', 'ms'])
+            for frame in profile_frames():
+                for name, call in frame['calls'].items():
+                    writer.writerow([frame['frame'], f"{frame['ms']:.4f}", name,
+                                     call['count'], f"{call['ms']:.4f}"])
+    else:
+        import json
+        with open(path, 'w') as f:
+            json.dump({'summary': profile_summary(), 'frames': profile_frames()},
+                      f, indent=1)
+
+def _profile_report():
+    """Print the profile summary, one line per primitive"""
+    summary = profile_summary()
+    print(f"gint profile: {summary['frames']} frames, "
+          f"{summary['ms_per_frame']:.3f} ms/frame", file=sys.stderr)
+    for name, p in summary['primitives'].items():
+        print(f"  {name:<18} {p['count']:>9} calls {p['ms_per_frame']:>9.3f} ms/frame",
+              file=sys.stderr)
+
+def _draw_profile_hud() -> pygame.Rect:
+    """Draw ms/frame and the top primitives over the window, return the
+    covered area in VRAM coordinates"""
+    recent = list(_profile_frames)[-30:]
+    lines = []
+    if recent:
+        ms = sum(seconds for _, seconds, _ in recent) * 1000 / len(recent)
+        lines.append(f"{ms:.1f} ms/frame")
+        totals = {}
+        for _, _, calls in recent:
+            for name, (count, t) in calls.items():
+                totals[name] = totals.get(name, 0.0) + t
+        top = sorted(totals.items(), key=lambda kv: -kv[1])[:3]
+        lines += [f"{name} {t * 1000 / len(recent):.2f}" for name, t in top]
+    else:
+        lines.append("-- ms/frame")
+    if _cost_frames:
+        recent = list(_cost_frames)[-30:]
+        device = sum(f[2] for f in recent) * 1000 / len(recent)
+        lines.insert(1, f"{device:.1f} ms/frame (device)")
+
+    width = max(sum(_advances(_default_font, line)) for line in lines) + 4
+    height = len(lines) * (GLYPH_HEIGHT + 2) + 2
+    hud = pygame.Surface((width, height))
+    hud.fill((0, 0, 0))
+    for i, line in enumerate(lines):
+        cursor_x = 2
+        for char in line:
+            glyph, w = _colored_glyph(_default_font, char, (255, 255, 0))
+            hud.blit(glyph, (cursor_x - GAP, 2 + i * (GLYPH_HEIGHT + 2) - GAP))
+            cursor_x += w + _default_font.char_spacing
+    if SCALE > 1:
+        hud = pygame.transform.scale(hud, (width * SCALE, height * SCALE))
+    screen.blit(hud, (0, 0))
+    return pygame.Rect(0, 0, width, height)
+
+# ---------------------------------------------------------------------------
+
+# Draw-call recorder and replayer. The log starts with _RECORD_MAGIC and holds
+# one record per outermost drawing call (dupdate() included, which delimits
+# frames). Values use a small tagged encoding with zigzag varints; buffers,
+# images and fonts are written once and then referenced by id.
+#
+#   call:    opcode (index in _RECORDED), args (list value), kwargs (dict value)
+#   blob:    _REC_BLOB, id, length, raw bytes
+#   image:   _REC_IMAGE, id, the Image() constructor arguments (list value)
+#   font:    _REC_FONT, id, the GintFont() constructor arguments (list value)
+
+_RECORDED = (
+    'dclear', 'dupdate', 'dpixel', 'drect', 'drect_border', 'dline',
+    'dhline', 'dvline', 'dcircle', 'dellipse', 'dpoly', 'dtext', 'dtext_opt',
+    'dimage', 'dsubimage', 'dsubimage_rgb565', 'dwindow_set', 'dfont',
+    'drect_many', 'dline_many', 'dpixel_many', 'dpoly_many',
+)
+_RECORD_MAGIC = b'GINTREC1'
+_REC_BLOB = 0xFD
+_REC_IMAGE = 0xFE
+_REC_FONT = 0xFF
+
+_FONT_FIELDS = ('prop', 'line_height', 'data_height', 'block_count', 'glyph_count',
+                'char_spacing', 'line_distance', 'blocks', 'data', 'width',
+                'storage_size', 'glyph_index', 'glyph_width')
+
+_recorder = None
+
+class _Recorder:
+    """Serializes drawing calls to a binary log"""
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.file.write(_RECORD_MAGIC)
+        self.opcodes = {name: i for i, name in enumerate(_RECORDED)}
+        self.blobs = {}     # sha1 -> id
+        self.objects = {}   # id(obj) -> (obj, id); obj is kept so ids stay unique
+        self.calls = 0
+
+    def _varint(self, out: bytearray, n: int):
+        self._uvarint(out, n << 1 if n >= 0 else (~n << 1) | 1)
+
+    def _uvarint(self, out: bytearray, n: int):
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def _blob(self, data) -> int:
+        data = bytes(data)
+        digest = hashlib.sha1(data).digest()
+        blob_id = self.blobs.get(digest)
+        if blob_id is None:
+            blob_id = self.blobs[digest] = len(self.blobs)
+            out = bytearray((_REC_BLOB,))
+            self._uvarint(out, blob_id)
+            self._uvarint(out, len(data))
+            self.file.write(out)
+            self.file.write(data)
+        return blob_id
+
+    def _object(self, obj, kind: int, fields: list) -> int:
+        known = self.objects.get(id(obj))
+        if known is not None:
+            return known[1]
+        obj_id = len(self.objects)
+        self.objects[id(obj)] = (obj, obj_id)
+        out = bytearray((kind,))
+        self._uvarint(out, obj_id)
+        self._value(out, fields)
+        self.file.write(out)
+        return obj_id
+
+    def _value(self, out: bytearray, v):
+        if v is None:
+            out += b'N'
+        elif v is True or v is False:
+            out += b'T' if v else b'F'
+        elif isinstance(v, int):
+            out += b'i'
+            self._varint(out, v)
+        elif isinstance(v, float):
+            out += b'f'
+            out += struct.pack('<d', v)
+        elif isinstance(v, str):
+            data = v.encode('utf-8', 'surrogatepass')
+            out += b's'
+            self._uvarint(out, len(data))
+            out += data
+        elif isinstance(v, array.array) or (isinstance(v, memoryview)
+                                            and v.format in array.typecodes):
+            # Typed buffers (coordinate arrays) are replayed as array.array
+            out += b'a'
+            out.append(ord(v.typecode if isinstance(v, array.array) else v.format))
+            self._uvarint(out, self._blob(v))
+        elif isinstance(v, (bytes, bytearray, memoryview, array.array)):
+            blob_id = self._blob(v)
+            out += b'b'
+            self._uvarint(out, blob_id)
+        elif isinstance(v, (list, tuple)):
+            out += b'l'
+            self._uvarint(out, len(v))
+            for item in v:
+                self._value(out, item)
+        elif isinstance(v, dict):
+            out += b'd'
+            self._uvarint(out, len(v))
+            for key, item in v.items():
+                self._value(out, key)
+                self._value(out, item)
+        elif isinstance(v, Image):
+            obj_id = self._object(v, _REC_IMAGE, [
+                v.format, v.profile, v.color_count, v.width, v.height,
+                v.stride, v.data, v.palette])
+            out += b'I'
+            self._uvarint(out, obj_id)
+        elif isinstance(v, GintFont):
+            obj_id = self._object(v, _REC_FONT,
+                                  [getattr(v, field) for field in _FONT_FIELDS])
+            out += b'G'
+            self._uvarint(out, obj_id)
+        else:
+            raise TypeError(f"Cannot record value of type {type(v).__name__}")
+
+    def call(self, name: str, args: tuple, kwargs: dict):
+        out = bytearray((self.opcodes[name],))
+        self._value(out, list(args))
+        self._value(out, kwargs)
+        self.file.write(out)
+        self.calls += 1
+
+    def close(self):
+        self.file.close()
+
+def record_start(path: str):
+    """Start recording every drawing call (and frame boundaries) to path."""
+    global _recorder
+    record_stop()
+    _recorder = _Recorder(path)
+    _instrument()
+
+def record_stop():
+    """Stop recording and close the log."""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+        _instrument()
+
+class _LogReader:
+    """Decodes a draw-call log back into (name, args, kwargs) tuples"""
+    def __init__(self, data: bytes):
+        if not data.startswith(_RECORD_MAGIC):
+            raise ValueError("Not a gint draw-call log")
+        self.data = data
+        self.pos = len(_RECORD_MAGIC)
+        self.blobs = {}
+        self.objects = {}
+
+    def _uvarint(self) -> int:
+        n = shift = 0
+        data = self.data
+        while True:
+            b = data[self.pos]
+            self.pos += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def _value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == 0x69:     # 'i'
+            n = self._uvarint()
+            return (n >> 1) ^ -(n & 1)
+        if tag == 0x6C:     # 'l'
+            return [self._value() for _ in range(self._uvarint())]
+        if tag == 0x73:     # 's'
+            size = self._uvarint()
+            self.pos += size
+            return self.data[self.pos - size:self.pos].decode('utf-8', 'surrogatepass')
+        if tag == 0x4E:     # 'N'
+            return None
+        if tag == 0x54:     # 'T'
+            return True
+        if tag == 0x46:     # 'F'
+            return False
+        if tag == 0x66:     # 'f'
+            self.pos += 8
+            return struct.unpack('<d', self.data[self.pos - 8:self.pos])[0]
+        if tag == 0x62:     # 'b'
+            return self.blobs[self._uvarint()]
+        if tag == 0x61:     # 'a'
+            typecode = chr(self.data[self.pos])
+            self.pos += 1
+            return array.array(typecode, self.blobs[self._uvarint()])
+        if tag == 0x64:     # 'd'
+            return {self._value(): self._value() for _ in range(self._uvarint())}
+        if tag in (0x49, 0x47):  # 'I', 'G'
+            return self.objects[self._uvarint()]
+        raise ValueError(f"Corrupted draw-call log at offset {self.pos - 1}")
+
+    def __iter__(self):
+        data = self.data
+        while self.pos < len(data):
+            op = data[self.pos]
+            self.pos += 1
+            if op == _REC_BLOB:
+                blob_id = self._uvarint()
+                size = self._uvarint()
+                self.blobs[blob_id] = data[self.pos:self.pos + size]
+                self.pos += size
+            elif op == _REC_IMAGE:
+                obj_id = self._uvarint()
+                self.objects[obj_id] = Image(*self._value())
+            elif op == _REC_FONT:
+                obj_id = self._uvarint()
+                self.objects[obj_id] = GintFont(*self._value())
+            else:
+                yield _RECORDED[op], self._value(), self._value()
+
+def replay(path: str, checksums: bool = False) -> dict:
+    """
+    Re-execute a draw-call log as fast as possible.
+
+    dupdate() records only push VRAM to the window (when there is one): no
+    frame-rate sleep and no frame limit. Returns {'frames', 'calls',
+    'seconds'} and, with checksums=True, the CRC32 of VRAM at every frame
+    (to diff rendering between gint versions).
+    """
+    with open(path, 'rb') as f:
+        reader = _LogReader(f.read())
+    _ensure_display()
+    g = globals()
+    sums = []
+    frames = calls = 0
+    t0 = time.perf_counter()
+    for name, args, kwargs in reader:
+        calls += 1
+        if name == 'dupdate':
+            if screen is not None:
+                _present()
+            else:
+                _reset_damage()
+            frames += 1
+            if checksums:
+                sums.append(zlib.crc32(pygame.image.tostring(vram, 'RGB')))
+            continue
+        _primitives.get(name, g[name])(*args, **kwargs)
+    result = {'frames': frames, 'calls': calls,
+              'seconds': time.perf_counter() - t0}
+    if checksums:
+        result['checksums'] = sums
+    return result
+
+# ---------------------------------------------------------------------------
+
+# Device cost model: predicts how long a frame would take on the calculator
+# (SH4 at COST_CPU_HZ running MicroPython), where drawing and bytecode are far
+# slower than on the desktop. Each outermost primitive costs a base number of
+# cycles plus cycles per pixel touched (COST_TABLE, rough estimates to be
+# calibrated against real measurements), and every executed line of app code
+# costs COST_LINE_CYCLES, counted with sys.settrace() on sampled frames.
+#
+# GINT_COSTMODEL=1 (or a JSON table, see costmodel_enable()) reports the
+# prediction at exit; GINT_COSTMODEL_THROTTLE=1 also slows frames down to the
+# predicted pace. Line counting replaces any active trace function (debugger,
+# coverage) while a frame is sampled.
+
+COST_CPU_HZ = 118_000_000
+COST_LINE_CYCLES = 250
+COST_DEFAULT = (800, 0.0)
+
+COST_TABLE = {
+    # name: (base cycles, cycles per pixel)
+    'dclear': (2000, 1.0),
+    'dupdate': (20000, 4.0),
+    'dpixel': (600, 0.0),
+    'dgetpixel': (600, 0.0),
+    'drect': (1500, 1.0),
+    'drect_border': (3000, 1.0),
+    'dline': (1500, 12.0),
+    'dhline': (800, 1.0),
+    'dvline': (800, 2.0),
+    'dcircle': (4000, 1.5),
+    'dellipse': (4000, 1.5),
+    'dpoly': (6000, 1.5),
+    'dtext': (3000, 3.0),
+    'dtext_opt': (3000, 3.0),
+    'dsize': (1500, 0.5),
+    'dnsize': (1500, 0.5),
+    'drsize': (1500, 0.5),
+    'dsize_prefix': (2000, 0.5),
+    'dimage': (2500, 2.0),
+    'dsubimage': (3000, 2.0),
+    'dsubimage_rgb565': (3000, 2.5),
+}
+
+_cost_enabled = False
+_cost_throttle = False
+_cost_sample = 1             # count lines every N frames, extrapolate between
+_cost_frames = collections.deque(maxlen=120)  # (frame, desktop s, device s, lines)
+_cost_cycles = 0.0           # primitive cycles of the frame in progress
+_cost_lines = 0              # traced lines of the frame in progress
+_cost_last_lines = 0
+_cost_sampling = False       # whether lines of the frame in progress are counted
+_cost_frame_start = None
+
+def _cost_area(name: str, args: tuple, kwargs: Optional[dict] = None) -> int:
+    """Number of pixels a primitive touches, estimated from its arguments"""
+    kwargs = kwargs or {}
+    try:
+        if name in ('drect', 'drect_border', 'dellipse'):
+            x1, y1, x2, y2 = args[:4]
+            return (abs(x2 - x1) + 1) * (abs(y2 - y1) + 1)
+        if name == 'dline':
+            x1, y1, x2, y2 = args[:4]
+            return max(abs(x2 - x1), abs(y2 - y1)) + 1
+        if name in ('dclear', 'dupdate'):
+            return DWIDTH * DHEIGHT
+        if name == 'dhline':
+            return DWIDTH
+        if name == 'dvline':
+            return DHEIGHT
+        if name == 'dcircle':
+            return (2 * args[2] + 1) ** 2
+        if name == 'dpoly':
+            xs, ys = args[0][0::2], args[0][1::2]
+            return (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1)
+        if name == 'dtext':
+            text = args[3] if len(args) > 3 else kwargs['text']
+            return len(text) * GLYPH_WIDTH * GLYPH_HEIGHT
+        if name == 'dtext_opt':
+            text = args[6] if len(args) > 6 else kwargs['text']
+            size = args[7] if len(args) > 7 else kwargs.get('size', -1)
+            if size >= 0:
+                text = text[:size]
+            return len(text) * GLYPH_WIDTH * GLYPH_HEIGHT
+        if name in ('dsize', 'dnsize', 'drsize', 'dsize_prefix'):
+            return len(args[0])
+        if name == 'dimage':
+            return args[2].width * args[2].height
+        if name == 'dsubimage':
+            return args[5] * args[6]
+        if name == 'dsubimage_rgb565':
+            scale = args[8] if len(args) > 8 else 1
+            return args[6] * args[7] * scale * scale
+    except (IndexError, KeyError, TypeError, ValueError, AttributeError):
+        pass
+    return 0
+
+# Batches cost what the loop of single primitives would cost on the device
+_COST_BATCHES = {'drect_many': ('drect', 4), 'dline_many': ('dline', 4),
+                 'dpixel_many': ('dpixel', 2)}
+
+def _cost_primitive(name: str, args: tuple, kwargs: Optional[dict] = None):
+    global _cost_cycles
+    batch = _COST_BATCHES.get(name)
+    if batch is not None:
+        single, stride = batch
+        color = args[1] if len(args) > 1 else (kwargs or {}).get('color')
+        for item in _batch_items(args[0], stride, color):
+            _cost_primitive(single, item)
+        return
+    if name == 'dpoly_many':
+        for vertices in args[0]:
+            _cost_primitive('dpoly', (vertices,) + tuple(args[1:]))
+        return
+    base, per_pixel = COST_TABLE.get(name, COST_DEFAULT)
+    _cost_cycles += base + (per_pixel * _cost_area(name, args, kwargs) if per_pixel else 0)
+
+# App code is traced line by line while the cost model samples a frame or the
+# heap model checks its budget on every line (GINT_HEAP_STRICT)
+
+_line_tracing = False
+
+def _trace_calls(frame, event, arg):
+    if frame.f_code.co_filename == __file__:
+        return None
+    return _trace_lines
+
+def _trace_lines(frame, event, arg):
+    global _cost_lines
+    if event == 'line':
+        if _cost_sampling:
+            _cost_lines += 1
+        if _heap_strict and _heap_enabled:
+            _heap_check(from_trace=True)
+    return _trace_lines
+
+def _update_line_tracing():
+    """Start or stop tracing lines, including in frames already running"""
+    global _line_tracing
+    enabled = _cost_sampling or (_heap_enabled and _heap_strict)
+    if enabled == _line_tracing and (not enabled or sys.gettrace() is _trace_calls):
+        return
+    _line_tracing = enabled
+    sys.settrace(_trace_calls if enabled else None)
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_filename != __file__:
+            frame.f_trace = _trace_lines if enabled else None
+        frame = frame.f_back
+
+def _cost_end_frame():
+    global _cost_cycles, _cost_lines, _cost_last_lines, _cost_frame_start
+    global _cost_sampling
+    now = time.perf_counter()
+    if _cost_sampling:
+        _cost_last_lines = _cost_lines
+    lines = _cost_last_lines
+    if _cost_frame_start is not None:
+        device = (_cost_cycles + lines * COST_LINE_CYCLES) / COST_CPU_HZ
+        desktop = now - _cost_frame_start
+        _cost_frames.append((_frame_count, desktop, device, lines))
+        if _cost_throttle and device > desktop:
+            time.sleep(device - desktop)
+            now = time.perf_counter()
+    _cost_cycles = 0.0
+    _cost_lines = 0
+    _cost_sampling = _frame_count % _cost_sample == 0
+    _update_line_tracing()
+    _cost_frame_start = now
+
+def costmodel_enable(enabled: bool = True, throttle: Optional[bool] = None,
+                     sample: Optional[int] = None, table: Optional[dict] = None):
+    """
+    Turn the device cost model on or off.
+
+    Args:
+        enabled: install or remove the instrumentation and line counting
+        throttle: sleep so that frames last as long as predicted on device
+        sample: count executed lines one frame out of `sample`
+        table: calibration, as {"cpu_hz": ..., "line_cycles": ...,
+               "primitives": {name: [base cycles, cycles per pixel]}}
+               or the path of a JSON file holding it
+    """
+    global _cost_enabled, _cost_throttle, _cost_sample, _cost_frame_start
+    global _cost_sampling
+    global COST_CPU_HZ, COST_LINE_CYCLES
+    if isinstance(table, str):
+        import json
+        with open(table) as f:
+            table = json.load(f)
+    if table:
+        COST_CPU_HZ = table.get('cpu_hz', COST_CPU_HZ)
+        COST_LINE_CYCLES = table.get('line_cycles', COST_LINE_CYCLES)
+        for name, (base, per_pixel) in table.get('primitives', {}).items():
+            COST_TABLE[name] = (base, per_pixel)
+    if throttle is not None:
+        _cost_throttle = throttle
+    if sample is not None:
+        _cost_sample = max(1, sample)
+
+    if enabled == _cost_enabled:
+        return
+    _cost_enabled = enabled
+    _cost_frame_start = time.perf_counter() if enabled else None
+    _cost_sampling = enabled
+    _update_line_tracing()
+    _instrument()
+
+def costmodel_frames() -> List[Tuple[int, float, float, int]]:
+    """Recent frames as (frame number, desktop seconds, predicted device seconds, lines)."""
+    return list(_cost_frames)
+
+def costmodel_summary() -> dict:
+    """Average desktop and predicted device ms/frame over the recorded frames."""
+    frames = list(_cost_frames)
+    n = max(1, len(frames))
+    return {
+        'frames': len(frames),
+        'desktop_ms': sum(f[1] for f in frames) * 1000 / n,
+        'device_ms': sum(f[2] for f in frames) * 1000 / n,
+        'lines': sum(f[3] for f in frames) / n,
+    }
+
+def _costmodel_report():
+    summary = costmodel_summary()
+    if summary['frames']:
+        print(f"gint: predicted {summary['device_ms']:.1f} ms/frame on device "
+              f"({summary['desktop_ms']:.1f} ms/frame here, "
+              f"{summary['lines']:.0f} lines/frame)", file=sys.stderr)
+
+# ---------------------------------------------------------------------------
+
+# Simulated MicroPython heap: allocations made after heap_enable() are traced
+# with tracemalloc and held to a budget (the calculator has a small heap where
+# the desktop has gigabytes). Only the app's allocations count: those made in
+# gint.py (caches, lookup tables, capture buffers), pygame and threading are
+# left out. Checks use the traced total minus an offset for the rest, which
+# a filtered snapshot measures again when usage grows or overflows, and which
+# grows by what each gint call keeps allocated. gc.mem_free()/gc.mem_alloc()
+# report against the budget, and MemoryError is raised once the peak since
+# the last check overflows it (only live memory is checked while a capture
+# runs, as its encoder thread allocates concurrently). Checks happen at every outermost primitive and gc.mem_*()
+# call, or at every line of app code with strict=True (GINT_HEAP_STRICT=1),
+# so that `except MemoryError` around an allocation behaves as on device.
+# Memory still live after an overflow stays allowed (the device would not
+# have allocated it), only further growth raises again. CPython objects are
+# bigger than MicroPython's (and each `from gint import *` also copies
+# pygame's constants), so budgets are approximate: leave some headroom.
+#
+# GINT_HEAP=<bytes, with optional k/M suffix, or 1 for HEAP_SIZE> enables it
+# at startup and prints the peak allocations by call site at exit.
+
+HEAP_SIZE = 512 * 1024
+
+_heap_enabled = False
+_heap_strict = False
+_heap_budget = HEAP_SIZE
+_heap_limit = HEAP_SIZE      # budget, raised to what was live at the last overflow
+_heap_base = 0               # app memory traced when the model was enabled
+_heap_offset = 0             # traced memory that is not the app's, at the last measure
+_heap_measured = 0           # app memory at the last measure
+_heap_peak = 0
+_heap_snapshot = None        # tracemalloc snapshot taken at the highest usage seen
+_heap_snapshot_size = 0
+_heap_errors = 0
+
+_HEAP_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, threading.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, os.path.join(os.path.dirname(pygame.__file__), "*")),
+)
+
+def _heap_check(from_trace: bool = False):
+    global _heap_peak, _heap_limit, _heap_errors, _line_tracing
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    offset = _heap_offset
+    current -= offset
+    peak = current if _capture is not None else peak - offset
+    if peak > _heap_limit or abs(current - _heap_measured) > _heap_measured // 8 + 16384:
+        current = _heap_measure()
+        peak = max(current, peak + offset - _heap_offset)
+    if peak > _heap_peak:
+        _heap_peak = peak
+    if peak > _heap_limit:
+        _heap_limit = max(_heap_budget, current)
+        _heap_errors += 1
+        if from_trace:
+            # The exception unsets the trace function; rearmed at the next check
+            _line_tracing = False
+        raise MemoryError(f"memory allocation failed, {peak} bytes used "
+                          f"out of a {_heap_budget} bytes heap")
+    if current <= _heap_budget:
+        _heap_limit = _heap_budget
+    if _heap_strict and not from_trace and not _line_tracing:
+        _update_line_tracing()
+
+def _heap_measure() -> int:
+    """App memory from a filtered snapshot, kept for the report at its highest"""
+    global _heap_offset, _heap_measured, _heap_snapshot, _heap_snapshot_size
+    total = tracemalloc.get_traced_memory()[0]
+    snapshot = tracemalloc.take_snapshot().filter_traces(_HEAP_FILTERS)
+    used = sum(trace.size for trace in snapshot.traces) - _heap_base
+    _heap_offset = total - used
+    _heap_measured = used
+    if used > _heap_snapshot_size:
+        _heap_snapshot = snapshot
+        _heap_snapshot_size = used
+    return used
+
+def _heap_internal(traced: int):
+    """After a gint call: what it kept allocated is not the app's, nor its peak"""
+    global _heap_offset
+    _heap_offset += tracemalloc.get_traced_memory()[0] - traced
+    tracemalloc.reset_peak()
+
+def _parse_size(text: str) -> int:
+    text = text.strip().lower()
+    for suffix, unit in (('k', 1024), ('m', 1024 * 1024)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * unit)
+    return int(text)
+
+def heap_enable(enabled: bool = True, budget: Optional[int] = None,
+                strict: Optional[bool] = None):
+    """
+    Turn the simulated heap on or off.
+
+    Args:
+        enabled: start or stop tracing allocations against the budget
+        budget: heap size in bytes (default HEAP_SIZE)
+        strict: check the budget at every line of app code, not only at
+            gint calls (slower)
+    """
+    global _heap_enabled, _heap_budget, _heap_limit, _heap_strict, _heap_base
+    global _heap_peak, _heap_snapshot, _heap_snapshot_size, _heap_errors
+    global _heap_offset, _heap_measured
+    if budget is not None:
+        _heap_budget = _heap_limit = budget
+    if strict is not None:
+        _heap_strict = strict
+
+    if enabled != _heap_enabled:
+        _heap_enabled = enabled
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _instrument()
+        if enabled:
+            _heap_base = 0
+            _heap_base = _heap_measure()
+            _heap_offset += _heap_base
+            _heap_measured = 0
+            _heap_peak = _heap_snapshot_size = _heap_errors = 0
+            _heap_snapshot = None
+        else:
+            tracemalloc.stop()
+    _update_line_tracing()
+
+def heap_stats() -> dict:
+    """Budget, live and peak bytes of the simulated heap, and MemoryErrors raised."""
+    used = _heap_measure() if _heap_enabled else 0
+    return {'budget': _heap_budget, 'used': used, 'free': max(0, _heap_budget - used),
+            'peak': _heap_peak, 'errors': _heap_errors}
+
+def _heap_exit():
+    heap_report()
+    heap_enable(False)      # no line tracing while the interpreter shuts down
+
+def heap_report(limit: int = 10, file=None):
+    """Print the peak usage and the call sites holding the most memory at that time."""
+    file = file or sys.stderr
+    stats = heap_stats()
+    print(f"gint: heap peak {stats['peak']} / {stats['budget']} bytes"
+          + (f", {stats['errors']} MemoryError(s)" if stats['errors'] else ""),
+          file=file)
+    if _heap_snapshot is None:
+        return
+    for stat in _heap_snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        print(f"  {stat.size:>9} B {stat.count:>6} blocks  "
+              f"{os.path.relpath(frame.filename)}:{frame.lineno}", file=file)
+
+# ---------------------------------------------------------------------------
+
+# Frame capture: dupdate() copies VRAM into a preallocated ring buffer, and a
+# background thread encodes the frames to an animated PNG, an animated GIF or
+# a raw RGB888 dump (for `ffmpeg -f rawvideo -pix_fmt rgb24 -s 320x528`). The
+# render loop only pays for a memory copy; when the encoder falls behind and
+# every slot is taken, frames are dropped instead of waiting. With wait=True
+# (GINT_CAPTURE_WAIT=1) the render loop waits for a free slot instead, and no
+# frame is lost; headless frames are timed at FPS rather than by the wall
+# clock, so such captures are deterministic. APNG/GIF frames only store the
+# area that changed since the previous one. GIF uses a fixed 3-3-2 palette, and
+# its LZW coder runs in Python (holding the GIL), so it is the slowest.
+#
+# GINT_CAPTURE=<file.png|file.gif|file.raw> captures from startup, and
+# GINT_CAPTURE_BUFFER sets the number of slots. Shift+PrintScreen starts and
+# stops a capture to capture.png. The time dupdate() spends copying (and
+# waiting) shows up as 'capture' in the profiler, not in 'dupdate'.
+
+CAPTURE_BUFFER = 16
+CAPTURE_FORMATS = {'.png': 'apng', '.apng': 'apng', '.gif': 'gif'}
+
+# Quantization of 8-bit channels to a 3-3-2 palette index, one table per channel
+_GIF_R = bytes(v & 0xe0 for v in range(256))
+_GIF_G = bytes((v >> 3) & 0x1c for v in range(256))
+_GIF_B = bytes(v >> 6 for v in range(256))
+_GIF_PALETTE = b''.join(bytes((r * 255 // 7, g * 255 // 7, b * 255 // 3))
+                        for r in range(8) for g in range(8) for b in range(4))
+
+_capture = None
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data)))
+
+def _gif_lzw(pixels: bytes) -> bytes:
+    """LZW-code 8-bit pixels as GIF image data (minimum code size 8)"""
+    clear, end = 256, 257
+    out = bytearray()
+    acc, nacc = clear, 9          # bit accumulator, clear code first
+    width, next_code = 9, 258
+    table = {}                    # (prefix << 8) | byte -> code
+    prefix = pixels[0]
+    for byte in pixels[1:]:
+        key = (prefix << 8) | byte
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        acc |= prefix << nacc
+        nacc += width
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            if next_code > 1 << width:
+                width += 1
+        else:
+            acc |= clear << nacc
+            nacc += width
+            table.clear()
+            width, next_code = 9, 258
+        while nacc >= 8:
+            out.append(acc & 0xff)
+            acc >>= 8
+            nacc -= 8
+        prefix = byte
+    acc |= prefix << nacc
+    nacc += width
+    if next_code < 4096 and next_code + 1 > 1 << width:
+        width += 1
+    acc |= end << nacc
+    nacc += width
+    out += acc.to_bytes((nacc + 7) // 8, 'little')
+
+    # Sub-blocks of at most 255 bytes, then the block terminator
+    blocks = bytearray()
+    for i in range(0, len(out), 255):
+        block = out[i:i + 255]
+        blocks.append(len(block))
+        blocks += block
+    blocks.append(0)
+    return bytes(blocks)
+
+def _changed_box(prev: bytes, cur: bytes, stride: int, bpp: int):
+    """Bounding box (x, y, w, h) of the pixels that differ, None if none do"""
+    rows = [y for y in range(len(cur) // stride)
+            if prev[y * stride:(y + 1) * stride] != cur[y * stride:(y + 1) * stride]]
+    if not rows:
+        return None
+    left, right = stride, 0
+    for y in rows:
+        a = prev[y * stride:(y + 1) * stride]
+        b = cur[y * stride:(y + 1) * stride]
+        # Binary searches for the common prefix and suffix of the row
+        lo, hi = 0, left
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if a[:mid] == b[:mid]:
+                lo = mid
+            else:
+                hi = mid - 1
+        left = lo
+        lo, hi = 0, stride - right
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if a[stride - mid:] == b[stride - mid:]:
+                lo = mid
+            else:
+                hi = mid - 1
+        right = stride - lo
+    x0, x1 = left // bpp, (right + bpp - 1) // bpp
+    return x0, rows[0], x1 - x0, rows[-1] - rows[0] + 1
+
+class _Capture:
+    """Ring buffer of raw VRAM copies and the thread encoding them"""
+    def __init__(self, path: str, format: str, slots: int, wait: bool = False):
+        if vram.get_bytesize() not in (3, 4) or vram.get_pitch() != DWIDTH * vram.get_bytesize():
+            raise ValueError("VRAM pixel format not supported for capture")
+        self.path = path
+        self.format = format
+        self.wait = wait
+        self.bpp = vram.get_bytesize()
+        # Offset of the R, G and B bytes in a pixel
+        self.offsets = [shift // 8 if sys.byteorder == 'little'
+                        else self.bpp - 1 - shift // 8
+                        for shift in vram.get_shifts()[:3]]
+        size = DWIDTH * DHEIGHT * self.bpp
+        self.free = collections.deque(bytearray(size) for _ in range(slots))
+        self.ready = collections.deque()
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.stats = {'captured': 0, 'dropped': 0, 'encoded': 0, 'bytes': 0,
+                      'copy_ms': 0.0, 'encode_ms': 0.0}
+        self.file = open(path, 'wb')
+        self.prev = None          # last encoded frame (RGB or palette indices)
+        self.pending = None       # (timestamp, frame, box) waiting for its delay
+        self.start = None
+        self.elapsed = 0          # delay units written so far
+        self.frames = 0
+        self.thread = threading.Thread(target=self._run, name="gint-capture", daemon=True)
+        self.thread.start()
+
+    def push(self):
+        """Copy VRAM into a free slot (render thread), or drop the frame"""
+        global _profile_nested
+        t0 = timestamp = time.perf_counter()
+        if _backend == BACKEND_HEADLESS:
+            # Headless frames are stamped at the nominal frame rate
+            timestamp = _frame_count / FPS
+        if self.wait:
+            with self.cond:
+                while not self.free:
+                    self.cond.wait()
+        elif not self.free:
+            self.stats['dropped'] += 1
+            return
+        slot = self.free.popleft()
+        memoryview(slot)[:] = vram.get_view('0')
+        with self.cond:
+            self.ready.append((timestamp, slot))
+            self.cond.notify_all()
+        self.stats['captured'] += 1
+        elapsed = time.perf_counter() - t0
+        self.stats['copy_ms'] += elapsed * 1000
+        if _profile_enabled:
+            entry = _profile_current.setdefault('capture', [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            _profile_nested += elapsed
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.ready and not self.stopping:
+                        self.cond.wait()
+                    if not self.ready:
+                        break
+                    timestamp, slot = self.ready.popleft()
+                t0 = time.perf_counter()
+                frame = self._convert(slot)
+                with self.cond:
+                    self.free.append(slot)
+                    self.cond.notify_all()
+                self._add(timestamp, frame)
+                self.stats['encode_ms'] += (time.perf_counter() - t0) * 1000
+            self._finish()
+        finally:
+            self.file.close()
+
+    def _convert(self, raw: bytearray) -> bytes:
+        """RGB888 bytes, or 3-3-2 palette indices for GIF"""
+        bpp = self.bpp
+        r, g, b = (raw[offset::bpp] for offset in self.offsets)
+        if self.format == 'gif':
+            return (int.from_bytes(r.translate(_GIF_R), 'big')
+                    | int.from_bytes(g.translate(_GIF_G), 'big')
+                    | int.from_bytes(b.translate(_GIF_B), 'big')).to_bytes(len(r), 'big')
+        rgb = bytearray(len(r) * 3)
+        rgb[0::3], rgb[1::3], rgb[2::3] = r, g, b
+        return bytes(rgb)
+
+    def _add(self, timestamp: float, frame: bytes):
+        if self.format == 'raw':
+            self._write(frame)
+            self.stats['encoded'] += 1
+            return
+        if self.start is None:
+            self.start = timestamp
+            self._header()
+            box = (0, 0, DWIDTH, DHEIGHT)
+        else:
+            bpp = 1 if self.format == 'gif' else 3
+            box = _changed_box(self.prev, frame, DWIDTH * bpp, bpp)
+            if box is None:
+                return            # identical: the pending frame lasts longer
+        if self.pending is not None:
+            self._frame(*self.pending, timestamp)
+        self.pending = (frame, box)
+        self.prev = frame
+
+    def _delay(self, timestamp: float, unit: int) -> int:
+        """Delay of the frame ending at timestamp, in 1/unit s, without drift"""
+        total = round((timestamp - self.start) * unit)
+        delay = max(1, total - self.elapsed)
+        self.elapsed += delay
+        return delay
+
+    def _write(self, data: bytes):
+        self.file.write(data)
+        self.stats['bytes'] += len(data)
+
+    def _header(self):
+        if self.format == 'gif':
+            self._write(b'GIF89a' + struct.pack('<HHBBB', DWIDTH, DHEIGHT, 0xf7, 0, 0)
+                        + _GIF_PALETTE
+                        + b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+        else:
+            self._write(b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', struct.pack(
+                '>IIBBBBB', DWIDTH, DHEIGHT, 8, 2, 0, 0, 0)))
+            self.actl = self.file.tell()
+            self._write(_png_chunk(b'acTL', struct.pack('>II', 0, 0)))
+            self.sequence = 0
+
+    def _frame(self, frame: bytes, box: tuple, end: float):
+        x, y, w, h = box
+        if self.format == 'gif':
+            pixels = b''.join(frame[row * DWIDTH + x:row * DWIDTH + x + w]
+                              for row in range(y, y + h))
+            self._write(b'\x21\xf9\x04' + struct.pack('<BHBB', 1 << 2, self._delay(end, 100), 0, 0)
+                        + b'\x2c' + struct.pack('<HHHHB', x, y, w, h, 0)
+                        + b'\x08' + _gif_lzw(pixels))
+        else:
+            stride = DWIDTH * 3
+            rows = b''.join(b'\x00' + frame[row * stride + x * 3:row * stride + (x + w) * 3]
+                            for row in range(y, y + h))
+            data = zlib.compress(rows, 6)
+            self._write(_png_chunk(b'fcTL', struct.pack(
+                '>IIIIIHHBB', self.sequence, w, h, x, y, self._delay(end, 1000), 1000, 0, 0)))
+            self.sequence += 1
+            if self.frames == 0:
+                self._write(_png_chunk(b'IDAT', data))
+            else:
+                self._write(_png_chunk(b'fdAT', struct.pack('>I', self.sequence) + data))
+                self.sequence += 1
+        self.frames += 1
+        self.stats['encoded'] += 1
+
+    def _finish(self):
+        if self.pending is not None:
+            # The last frame lasts as long as the one before it, or 100 ms
+            last = self.elapsed / (100 if self.format == 'gif' else 1000)
+            average = last / self.frames if self.frames else 0.1
+            self._frame(*self.pending, self.start + last + average)
+        if self.format == 'gif':
+            self._write(b'\x3b')
+        elif self.start is not None:
+            self._write(_png_chunk(b'IEND', b''))
+            self.file.seek(self.actl)
+            self.file.write(_png_chunk(b'acTL', struct.pack('>II', self.frames, 0)))
+
+def capture_start(path: str, format: Optional[str] = None,
+                  buffer: int = CAPTURE_BUFFER, wait: bool = False):
+    """
+    Start capturing every frame pushed by dupdate() to a file.
+
+    Args:
+        path: output file
+        format: 'apng', 'gif' or 'raw' (default: from the extension of path,
+            raw RGB888 frames for unknown extensions)
+        buffer: number of frames that can wait for the encoder before new
+            frames get dropped
+        wait: when the buffer is full, wait for the encoder instead of
+            dropping frames (stalls the render loop, loses no frame)
+    """
+    global _capture
+    if _capture is not None:
+        capture_stop()
+    if format is None:
+        format = CAPTURE_FORMATS.get(os.path.splitext(path)[1].lower(), 'raw')
+    if format not in ('apng', 'gif', 'raw'):
+        raise ValueError(f"Unknown capture format: {format}")
+    _capture = _Capture(path, format, max(1, buffer), wait)
+    atexit.unregister(capture_stop)     # finish the file even if never stopped
+    atexit.register(capture_stop)
+
+def capture_stop() -> Optional[dict]:
+    """Encode the frames still buffered, close the file and return capture_stats()."""
+    global _capture
+    if _capture is None:
+        return None
+    capture, _capture = _capture, None
+    capture.stop()
+    stats = dict(capture.stats, path=capture.path)
+    print(f"gint: captured {stats['encoded']} frames to {capture.path} "
+          f"({stats['dropped']} dropped)", file=sys.stderr)
+    return stats
+
+def capture_stats() -> dict:
+    """Frames captured, dropped and encoded so far, bytes written, time spent
+    copying (render thread) and encoding (capture thread) in ms."""
+    if _capture is None:
+        return {}
+    stats = dict(_capture.stats, path=_capture.path)
+    stats['queued'] = len(_capture.ready)
+    return stats
 
 #  --- Polyfill
     
@@ -1125,14 +3293,20 @@ if not hasattr(time, 'ticks_ms'):
 # Polyfills for MicroPython-specific gc functions
 if not hasattr(gc, 'mem_alloc'):
     def gc_mem_alloc() -> int:
-        """Polyfill for gc.mem_alloc. Not implementable in CPython, returns 0."""
+        """Polyfill for gc.mem_alloc. Bytes used in the simulated heap, if enabled, else 0."""
+        if _heap_enabled:
+            _heap_check()
+            return heap_stats()['used']
         print("Warning: gc.mem_alloc() is a MicroPython-specific function. Returning 0.")
         return 0
     gc.mem_alloc = gc_mem_alloc
 
 if not hasattr(gc, 'mem_free'):
     def gc_mem_free() -> int:
-        """Polyfill for gc.mem_free. Not implementable in CPython, returns a large number."""
+        """Polyfill for gc.mem_free. Bytes left in the simulated heap, if enabled, else a large number."""
+        if _heap_enabled:
+            _heap_check()
+            return heap_stats()['free']
         print("Warning: gc.mem_free() is a MicroPython-specific function. Returning a dummy value.")
         # Return a large number to avoid false "out of memory" errors in simulations
         return 1024 * 1024
@@ -1188,6 +3362,36 @@ if not hasattr(sys, 'print_exception'):
     sys.print_exception = sys_print_exception
 
 #  --- INIT STUFF
+
+_profile_target = os.environ.get("GINT_PROFILE", "")
+if _profile_target or os.environ.get("GINT_PROFILE_HUD", "") not in ("", "0"):
+    profile_enable(hud=os.environ.get("GINT_PROFILE_HUD", "") not in ("", "0"))
+    if _profile_target not in ("", "1"):
+        atexit.register(profile_export, _profile_target)
+    elif _profile_target == "1":
+        atexit.register(_profile_report)
+
+_costmodel_target = os.environ.get("GINT_COSTMODEL", "")
+if _costmodel_target not in ("", "0"):
+    costmodel_enable(table=None if _costmodel_target == "1" else _costmodel_target,
+                     throttle=os.environ.get("GINT_COSTMODEL_THROTTLE", "") not in ("", "0"))
+    atexit.register(_costmodel_report)
+
+if os.environ.get("GINT_HEAP", "") not in ("", "0"):
+    heap_enable(budget=None if os.environ["GINT_HEAP"] == "1" else _parse_size(os.environ["GINT_HEAP"]),
+                strict=os.environ.get("GINT_HEAP_STRICT", "") not in ("", "0"))
+    atexit.register(_heap_exit)
+
+if os.environ.get("GINT_INPUT"):
+    inject_script(os.environ["GINT_INPUT"])
+
+if os.environ.get("GINT_RECORD"):
+    record_start(os.environ["GINT_RECORD"])
+    atexit.register(record_stop)
+
+if os.environ.get("GINT_CAPTURE"):
+    capture_start(os.environ["GINT_CAPTURE"],
+                  buffer=int(os.environ.get("GINT_CAPTURE_BUFFER", CAPTURE_BUFFER)),
+                  wait=os.environ.get("GINT_CAPTURE_WAIT", "") not in ("", "0"))
     
-vram.fill(C_WHITE)
-dupdate()
\ No newline at end of file
+vram.fill(C_WHITE)
\ No newline at end of file
@@ -1,33 +1,35 @@
-# LZW Library for PythonExtra - Optimized with memoryview
+# LZW Library for PythonExtra - Integer-keyed dictionary, no per-byte allocation
+#
+# The dictionary is a trie: the string of code w followed by byte c is found
+# under the integer key (w << 8) | c, so compressing never builds bytes
+# objects. Decompressing copies strings from earlier output, located through
+# a code table, onto the end of a single output buffer. pack() and the
+# Encoder/Decoder classes store the codes bit-packed (see Packed container).
+
+import array
 
 def compress(data: bytes) -> list:
     """Compresses a sequence of bytes using the LZW algorithm."""
     if not data:
         return []
 
-    # memoryview allows slicing without copying bytes
-    mv = memoryview(data)
-    
+    dictionary = {}     # (prefix code << 8) | byte -> code
     dict_size = 256
-    dictionary = {bytes([i]): i for i in range(dict_size)}
-    
-    w = bytes()
     compressed_data = []
     
-    for i in range(len(mv)):
-        c = mv[i:i+1].tobytes() # Need bytes for dict key
-        wc = w + c
-        if wc in dictionary:
-            w = wc
+    it = iter(data)
+    w = next(it)
+    for c in it:
+        code = dictionary.get((w << 8) | c)
+        if code is not None:
+            w = code
         else:
-            compressed_data.append(dictionary[w])
-            dictionary[wc] = dict_size
+            compressed_data.append(w)
+            dictionary[(w << 8) | c] = dict_size
             dict_size += 1
             w = c
             
-    if w:
-        compressed_data.append(dictionary[w])
-        
+    compressed_data.append(w)
     return compressed_data
 
 def decompress(compressed_data: list) -> bytes:
@@ -35,24 +37,319 @@ def decompress(compressed_data: list) -> bytes:
     if not compressed_data:
         return b""
 
+    # Code table: the string of a code above 255 is the previous string plus
+    # one byte, which is already in the output right where that previous
+    # string was written, so a code is stored as (start, length) in the output
+    size = 256 + len(compressed_data)
+    start = [0] * size
+    length = [1] * size
+
+    w = compressed_data[0]
+    if w > 255:
+        raise ValueError("Bad compressed code")
+    out = bytearray()
+    out.append(w)
+    prev = 0
     dict_size = 256
-    # Pre-filling the dictionary with 256 byte objects
-    dictionary = {i: bytes([i]) for i in range(dict_size)}
-    
-    w = dictionary[compressed_data[0]]
-    result = [w]
-    
     for k in compressed_data[1:]:
-        if k in dictionary:
-            entry = dictionary[k]
-        elif k == dict_size:
-            entry = w + w[:1]
+        start[dict_size] = prev
+        length[dict_size] = length[w] + 1
+        dict_size += 1
+        prev = len(out)
+        if k < 256:
+            out.append(k)
+        elif k < dict_size - 1:
+            s = start[k]
+            out += out[s:s + length[k]]
+        elif k == dict_size - 1:
+            # Code defined by this very step: its last byte is its first
+            s = start[k]
+            out += out[s:s + length[k] - 1]
+            out.append(out[s])
         else:
             raise ValueError("Bad compressed code")
-            
-        result.append(entry)
-        dictionary[dict_size] = w + entry[:1]
-        dict_size += 1
-        w = entry
-        
-    return b"".join(result)
\ No newline at end of file
+        w = k
+
+    return bytes(out)
+
+# =============================================================================
+# Packed container
+# =============================================================================
+#
+# A 4-byte header (b'LZW' and the largest code width, 9 to 16) followed by
+# the codes packed least significant bit first. Codes start 9 bits wide and
+# widen by one bit whenever the decoder's next free code would not fit. When
+# every code of the largest width is taken, the encoder emits CLEAR and both
+# sides start over from the 256 single bytes. The last byte is padded with
+# zero bits, fewer than the narrowest code, so no end code is needed.
+#
+# Encoder and Decoder work on chunks, so a file of any size is compressed and
+# decompressed with bounded memory: the encoder keeps its dictionary and the
+# decoder a prefix/suffix table of 2 ** max_bits entries. pack() knows the
+# input size and picks the narrowest max_bits that never fills the dictionary,
+# so small inputs get small decoder tables (384 KB at 16 bits).
+
+MAGIC = b'LZW'
+MIN_BITS = 9
+MAX_BITS = 16
+CLEAR = 256         # dictionary reset
+FIRST_CODE = 257    # first code assigned to a string
+CHUNK_SIZE = 4096
+
+class Encoder:
+    """Incremental packed LZW compression: encode() chunks, then flush()"""
+    def __init__(self, max_bits: int = MAX_BITS):
+        if not MIN_BITS <= max_bits <= MAX_BITS:
+            raise ValueError("max_bits must be between 9 and 16")
+        self.max_bits = max_bits
+        self.limit = 1 << max_bits
+        self.dictionary = {}    # (prefix code << 8) | byte -> code
+        self.next_code = FIRST_CODE
+        self.width = MIN_BITS
+        self.w = -1             # code of the pending string, -1 before any input
+        self.acc = 0            # pending bits, least significant first
+        self.nbits = 0
+        self.header = True
+
+    def encode(self, data: bytes) -> bytes:
+        """Compress a chunk, return the packed bytes completed so far"""
+        out = bytearray()
+        if self.header:
+            out += MAGIC
+            out.append(self.max_bits)
+            self.header = False
+        if not data:
+            return bytes(out)
+
+        dictionary = self.dictionary
+        next_code = self.next_code
+        width = self.width
+        limit = self.limit
+        acc = self.acc
+        nbits = self.nbits
+        it = iter(data)
+        w = self.w
+        if w < 0:
+            w = next(it)
+        for c in it:
+            key = (w << 8) | c
+            code = dictionary.get(key)
+            if code is not None:
+                w = code
+                continue
+            acc |= w << nbits
+            nbits += width
+            if next_code < limit:
+                dictionary[key] = next_code
+                next_code += 1
+                if next_code > 1 << width:
+                    width += 1
+            else:
+                acc |= CLEAR << nbits
+                nbits += width
+                dictionary.clear()
+                next_code = FIRST_CODE
+                width = MIN_BITS
+            while nbits >= 8:
+                out.append(acc & 0xff)
+                acc >>= 8
+                nbits -= 8
+            w = c
+
+        self.w = w
+        self.next_code = next_code
+        self.width = width
+        self.acc = acc
+        self.nbits = nbits
+        return bytes(out)
+
+    def flush(self) -> bytes:
+        """Emit the pending string and the padding; the encoder is done"""
+        out = bytearray(self.encode(b""))
+        acc = self.acc
+        nbits = self.nbits
+        if self.w >= 0:
+            acc |= self.w << nbits
+            nbits += self.width
+            self.w = -1
+        while nbits > 0:
+            out.append(acc & 0xff)
+            acc >>= 8
+            nbits -= 8
+        self.acc = 0
+        self.nbits = 0
+        return bytes(out)
+
+
+class Decoder:
+    """Incremental packed LZW decompression: decode() chunks, then flush()"""
+    def __init__(self):
+        self.header = b""
+        self.max_bits = 0
+        self.acc = 0
+        self.nbits = 0
+
+    def _start(self, max_bits: int):
+        if not MIN_BITS <= max_bits <= MAX_BITS:
+            raise ValueError("Not a packed LZW stream")
+        self.max_bits = max_bits
+        self.limit = 1 << max_bits
+        # String of code k >= FIRST_CODE: string of prefix[k], then suffix[k].
+        # Built from zero bytes: a list of 2 ** 16 items would be far bigger
+        self.prefix = array.array('H', bytes(2 * self.limit))
+        self.suffix = bytearray(self.limit)
+        self.length = array.array('H', bytes(2 * self.limit))
+        for i in range(256):
+            self.length[i] = 1
+        self.scratch = bytearray(self.limit)
+        self._reset()
+
+    def _reset(self):
+        self.next_code = FIRST_CODE
+        self.width = MIN_BITS
+        self.w = -1             # previous code, -1 after a reset
+        self.first = 0          # first byte of the string of self.w
+
+    def decode(self, data: bytes) -> bytes:
+        """Decompress a chunk, return the bytes decoded so far"""
+        if self.max_bits == 0:
+            self.header += data
+            if len(self.header) < 4:
+                return b""
+            if self.header[:3] != MAGIC:
+                raise ValueError("Not a packed LZW stream")
+            self._start(self.header[3])
+            data = self.header[4:]
+            self.header = b""
+
+        out = bytearray()
+        prefix = self.prefix
+        suffix = self.suffix
+        length = self.length
+        scratch = self.scratch
+        limit = self.limit
+        next_code = self.next_code
+        width = self.width
+        mask = (1 << width) - 1
+        w = self.w
+        first = self.first
+        acc = self.acc
+        nbits = self.nbits
+        for byte in data:
+            acc |= byte << nbits
+            nbits += 8
+            while nbits >= width:
+                k = acc & mask
+                acc >>= width
+                nbits -= width
+                if k == CLEAR:
+                    next_code = FIRST_CODE
+                    width = MIN_BITS
+                    mask = (1 << width) - 1
+                    w = -1
+                    continue
+                if w < 0:
+                    if k > 255:
+                        raise ValueError("Bad compressed code")
+                    out.append(k)
+                    w = first = k
+                    continue
+                if k > next_code or next_code >= limit:
+                    raise ValueError("Bad compressed code")
+                if k == next_code:
+                    # Code defined by this very step: its last byte is its first
+                    prefix[k] = w
+                    suffix[k] = first
+                    length[k] = length[w] + 1
+                if k < 256:
+                    out.append(k)
+                    first = k
+                else:
+                    n = length[k]
+                    i = n - 1
+                    c = k
+                    while c >= FIRST_CODE:
+                        scratch[i] = suffix[c]
+                        c = prefix[c]
+                        i -= 1
+                    scratch[0] = c
+                    first = c
+                    out += memoryview(scratch)[:n]
+                if k != next_code:
+                    prefix[next_code] = w
+                    suffix[next_code] = first
+                    length[next_code] = length[w] + 1
+                next_code += 1
+                if next_code >= 1 << width and width < self.max_bits:
+                    width += 1
+                    mask = (1 << width) - 1
+                w = k
+
+        self.next_code = next_code
+        self.width = width
+        self.w = w
+        self.first = first
+        self.acc = acc
+        self.nbits = nbits
+        return bytes(out)
+
+    def flush(self) -> bytes:
+        """Check that the stream ended cleanly; the decoder is done"""
+        if self.max_bits == 0:
+            raise ValueError("Truncated packed LZW stream")
+        if self.nbits >= 8 or self.acc:
+            raise ValueError("Truncated packed LZW stream")
+        return b""
+
+
+def _chunks(source, chunk_size: int):
+    """Chunks of a file-like object (anything with read()) or of an iterable"""
+    if hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+def iter_pack(source, chunk_size: int = CHUNK_SIZE, max_bits: int = MAX_BITS):
+    """Packed LZW chunks of a file-like object or an iterable of chunks"""
+    encoder = Encoder(max_bits)
+    for chunk in _chunks(source, chunk_size):
+        out = encoder.encode(chunk)
+        if out:
+            yield out
+    yield encoder.flush()
+
+def iter_unpack(source, chunk_size: int = CHUNK_SIZE):
+    """Decompressed chunks of a packed LZW file-like object or iterable"""
+    decoder = Decoder()
+    for chunk in _chunks(source, chunk_size):
+        out = decoder.decode(chunk)
+        if out:
+            yield out
+    decoder.flush()
+
+def bits_for(size: int) -> int:
+    """Code width that never fills up on size bytes, at most MAX_BITS"""
+    bits = MIN_BITS
+    while bits < MAX_BITS and (1 << bits) < size + FIRST_CODE:
+        bits += 1
+    return bits
+
+def pack(data: bytes, max_bits: int = None) -> bytes:
+    """
+    Compresses bytes into the packed LZW container. max_bits defaults to
+    bits_for(len(data)).
+    """
+    encoder = Encoder(bits_for(len(data)) if max_bits is None else max_bits)
+    return encoder.encode(data) + encoder.flush()
+
+def unpack(packed: bytes) -> bytes:
+    """Decompresses a packed LZW container back into bytes."""
+    decoder = Decoder()
+    out = decoder.decode(packed)
+    decoder.flush()
+    return out
\ No newline at end of file
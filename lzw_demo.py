@@ -24,6 +24,7 @@ def show_results(original_text):
     start_t = time.monotonic()
     compressed = lzw.compress(data)
     end_t = time.monotonic()
+    packed = lzw.pack(data)
     
     decompressed = lzw.decompress(compressed)
     
@@ -55,8 +56,8 @@ def show_results(original_text):
         
         y += 45
         # Stats
-        # Assume 16-bit codes (2 bytes) for ratio calculation
-        ratio = (len(compressed) * 2 / len(data)) * 100 if len(data) > 0 else 0
+        # Codes stored 9 to 16 bits wide, header included
+        ratio = (len(packed) / len(data)) * 100 if len(data) > 0 else 0
         dtext(margin, y, t['txt_dim'], "Performance:")
         y += 20
         dtext(margin + 10, y, t['txt'], "Ratio: {:.1f}%".format(ratio))
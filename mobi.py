@@ -1,6 +1,6 @@
 # MOBI & PalmDB Parser for PythonExtra
 from struct import unpack, calcsize
-from compression import lz77_decompress as uncompress
+from compression import lz77_decompress as uncompress, LZ77Decoder
 
 def LOG(*args):
     pass # Silent by default to save I/O time
@@ -108,6 +108,7 @@ class Book:
         self.author = "Unknown"
         self.language = "Unknown"
         self.is_a_book = False
+        self._lz77 = None   # streaming decoder, reused from record to record
         
         try:
             with open(fn, 'rb') as f:
@@ -172,18 +173,23 @@ class Book:
            raw_data.startswith(b'BOUNDARY') or raw_data.startswith(b'FDST'):
             return ""
             
-        try:
-            decompressed = uncompress(raw_data)
-        except Exception:
-            # Safely skip index errors during corrupt decompression
-            return ""
+        # Decompress a chunk at a time: only the LZ77 window is held, never
+        # the whole decompressed record
+        if self._lz77 is None:
+            self._lz77 = LZ77Decoder()
+        self._lz77.reset(raw_data)
         
         # Simple HTML tag stripper
         res = bytearray()
         in_tag = False
-        for b in decompressed:
-            if b == 60: in_tag = True       # '<'
-            elif b == 62: in_tag = False    # '>'
-            elif not in_tag: res.append(b)
+        try:
+            for chunk in self._lz77:
+                for b in chunk:
+                    if b == 60: in_tag = True       # '<'
+                    elif b == 62: in_tag = False    # '>'
+                    elif not in_tag: res.append(b)
+        except Exception:
+            # Safely skip errors during corrupt decompression
+            return ""
             
         return res.decode('utf-8', 'ignore').replace('&nbsp;', ' ')
\ No newline at end of file
@@ -1,5 +1,10 @@
 from gint import *
 
+try:
+    from gint import drect_many
+except ImportError:
+    drect_many = None
+
 # =============================================================================
 # OPTIMIZED QR CODE ENGINE (V1 to V10, 8-bit mode only)
 # =============================================================================
@@ -276,7 +281,24 @@ def draw_qr(qr, x, y, size, fg=C_BLACK, bg=C_WHITE):
     # White background with safety padding for reliable scanning
     drect(ox - padding*scale, oy - padding*scale, ox + actual_size + padding*scale, oy + actual_size + padding*scale, bg)
     
+    # One rectangle per horizontal run of dark modules, all sent in one call
+    # when the batched API is available
+    rects = [] if drect_many else None
     for r in range(qr.mc):
-        for c in range(qr.mc):
-            if qr.modules[r][c]:
-                drect(ox + c*scale, oy + r*scale, ox + c*scale + scale - 1, oy + r*scale + scale - 1, fg)
\ No newline at end of file
+        row = qr.modules[r]
+        y1 = oy + r*scale
+        c = 0
+        while c < qr.mc:
+            if not row[c]:
+                c += 1
+                continue
+            start = c
+            while c < qr.mc and row[c]:
+                c += 1
+            x1, x2, y2 = ox + start*scale, ox + c*scale - 1, y1 + scale - 1
+            if rects is None:
+                drect(x1, y1, x2, y2, fg)
+            else:
+                rects += (x1, y1, x2, y2)
+    if rects:
+        drect_many(rects, fg)
\ No newline at end of file
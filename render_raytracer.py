@@ -1,6 +1,11 @@
 from gint import *
 from math import sqrt
 
+try:
+    from gint import dpixel_many, drect_many
+except ImportError:
+    dpixel_many = drect_many = None
+
 # Config
 W, H = 64, 64       # Internal render resolution
 SCALE = 4           # Upscale factor (64 * 4 = 256px width)
@@ -31,6 +36,7 @@ def run():
     # Loop over every pixel of the SMALL resolution
     for y in range(H):
         v = (1.0 - 2.0 * y / H) # Map Y to [-1, 1]
+        row = [] # Colors of this line, drawn at once with the batched API
         
         for x in range(W):
             u = (2.0 * x / W - 1.0) # Map X to [-1, 1]
@@ -114,6 +120,10 @@ def run():
                               int(base_c[2] * intensity))
 
             # 4. Drawing
+            if drect_many:
+                row.append(color)
+                continue
+
             # Draw the computed pixel at original size (Top)
             dpixel(OX + x, OY + y, color)
             
@@ -121,6 +131,12 @@ def run():
             # We draw a rectangle of SCALE x SCALE size
             rx, ry = BX + x * SCALE, BY + y * SCALE
             drect(rx, ry, rx + SCALE - 1, ry + SCALE - 1, color)
+
+        if row:
+            ry = BY + y * SCALE
+            dpixel_many([v for x, c in enumerate(row) for v in (OX + x, OY + y, c)])
+            drect_many([v for x, c in enumerate(row)
+                        for v in (BX + x * SCALE, ry, BX + x * SCALE + SCALE - 1, ry + SCALE - 1, c)])
         
         # Update screen every 4 lines to show progress nicely
         if y % 4 == 0:
@@ -0,0 +1,302 @@
+"""
+Retained sprite layer on top of gint.
+
+Sprites are images (or frames of an image atlas) with a position, a z-order
+and a visibility flag. A Tilemap is a grid of tile indices over an image
+atlas. A Layer remembers what it drew: when sprites move, change or disappear
+it restores the background under their old position and redraws only the
+sprites overlapping the regions that changed, so the cost of a frame follows
+the number of changes rather than the number of sprites.
+
+    layer = Layer(C_WHITE)
+    ship = layer.add(Sprite(ship_img, 10, 20, z=1))
+    while True:
+        ship.move(ship.x + 1, ship.y)
+        layer.draw()
+        dupdate()
+
+Everything is drawn with dsubimage() and drect(), so this module runs on the
+calculator as well as in the emulator. Anything the app draws itself over
+the layer is only overwritten where the layer changes; call invalidate()
+after clearing the screen.
+"""
+
+from gint import *
+
+# Size of the spatial hash cells used to find the sprites over a region
+CELL = 32
+
+def _intersect(a, b):
+    x = max(a[0], b[0])
+    y = max(a[1], b[1])
+    right = min(a[0] + a[2], b[0] + b[2])
+    bottom = min(a[1] + a[3], b[1] + b[3])
+    if right <= x or bottom <= y:
+        return None
+    return (x, y, right - x, bottom - y)
+
+def _union(a, b):
+    x = min(a[0], b[0])
+    y = min(a[1], b[1])
+    right = max(a[0] + a[2], b[0] + b[2])
+    bottom = max(a[1] + a[3], b[1] + b[3])
+    return (x, y, right - x, bottom - y)
+
+def _merge(rects):
+    """Merge overlapping rectangles until none overlap"""
+    merged = []
+    for r in rects:
+        i = 0
+        while i < len(merged):
+            if _intersect(r, merged[i]):
+                r = _union(r, merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(r)
+    return merged
+
+class Sprite:
+    """An image, or a frame (left, top, width, height) of an image atlas"""
+    def __init__(self, img, x=0, y=0, z=0, frame=None, visible=True):
+        self.img = img
+        self.frame = frame or (0, 0, img.width, img.height)
+        self.x = x
+        self.y = y
+        self.z = z
+        self.visible = visible
+        self.layer = None
+        self._drawn = None      # screen rectangle covered at the last draw
+        self._seq = 0           # insertion order, breaks z ties
+
+    def rect(self):
+        return (self.x, self.y, self.frame[2], self.frame[3])
+
+    def _changed(self):
+        if self.layer is not None:
+            self.layer._changed.add(self)
+
+    def move(self, x, y):
+        if x != self.x or y != self.y:
+            self.x = x
+            self.y = y
+            self._changed()
+
+    def set_image(self, img, frame=None):
+        frame = frame or (0, 0, img.width, img.height)
+        if img is not self.img or frame != self.frame:
+            self.img = img
+            self.frame = frame
+            self._changed()
+
+    def set_frame(self, frame):
+        self.set_image(self.img, frame)
+
+    def set_z(self, z):
+        if z != self.z:
+            self.z = z
+            self._changed()
+
+    def show(self, visible=True):
+        if visible != self.visible:
+            self.visible = visible
+            self._changed()
+
+    def hide(self):
+        self.show(False)
+
+    def _draw(self, clip):
+        """Draw the part of the sprite inside clip"""
+        r = _intersect(self.rect(), clip)
+        if r is not None:
+            left, top = self.frame[0], self.frame[1]
+            dsubimage(r[0], r[1], self.img, left + r[0] - self.x,
+                      top + r[1] - self.y, r[2], r[3])
+
+
+class Tilemap:
+    """Grid of tile indices (row-major, -1 for no tile) over an image atlas"""
+    def __init__(self, img, tile_w, tile_h, cols, rows, tiles=None, x=0, y=0):
+        self.img = img
+        self.tile_w = tile_w
+        self.tile_h = tile_h
+        self.cols = cols
+        self.rows = rows
+        self.tiles = list(tiles) if tiles is not None else [-1] * (cols * rows)
+        if len(self.tiles) != cols * rows:
+            raise ValueError("Tilemap needs cols * rows tile indices")
+        self.x = x
+        self.y = y
+        self._per_row = img.width // tile_w
+        self._changed = []      # rectangles of tiles changed since the last draw
+
+    def rect(self):
+        return (self.x, self.y, self.cols * self.tile_w, self.rows * self.tile_h)
+
+    def cell_rect(self, col, row):
+        return (self.x + col * self.tile_w, self.y + row * self.tile_h,
+                self.tile_w, self.tile_h)
+
+    def get(self, col, row):
+        return self.tiles[row * self.cols + col]
+
+    def set(self, col, row, index):
+        i = row * self.cols + col
+        if self.tiles[i] != index:
+            self.tiles[i] = index
+            self._changed.append(self.cell_rect(col, row))
+
+    def draw(self, clip=None):
+        """Draw the tiles overlapping clip (the whole map by default)"""
+        area = self.rect() if clip is None else _intersect(self.rect(), clip)
+        if area is None:
+            return
+        tw, th = self.tile_w, self.tile_h
+        col0 = (area[0] - self.x) // tw
+        row0 = (area[1] - self.y) // th
+        col1 = (area[0] + area[2] - 1 - self.x) // tw
+        row1 = (area[1] + area[3] - 1 - self.y) // th
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = self.tiles[row * self.cols + col]
+                if index < 0:
+                    continue
+                x = self.x + col * tw
+                y = self.y + row * th
+                r = _intersect((x, y, tw, th), area)
+                left = (index % self._per_row) * tw
+                top = (index // self._per_row) * th
+                dsubimage(r[0], r[1], self.img, left + r[0] - x, top + r[1] - y,
+                          r[2], r[3])
+
+
+class Layer:
+    """
+    Sprites over a background (a color or an image at (0, 0)) and an optional
+    tilemap. draw() updates VRAM with what changed since the previous call.
+    """
+    def __init__(self, background=C_WHITE, tilemap=None):
+        self.background = background
+        self.tilemap = tilemap
+        self.bounds = (0, 0, DWIDTH, DHEIGHT)
+        self.sprites = []
+        self._changed = set()
+        self._erased = []       # rectangles of removed sprites
+        self._cells = {}        # (cx, cy) -> set of sprites drawn over that cell
+        self._seq = 0
+        self._full = True
+
+    def add(self, sprite):
+        if sprite.layer is not None:
+            sprite.layer.remove(sprite)
+        sprite.layer = self
+        self._seq += 1
+        sprite._seq = self._seq
+        self.sprites.append(sprite)
+        self._changed.add(sprite)
+        return sprite
+
+    def remove(self, sprite):
+        if sprite.layer is not self:
+            return
+        if sprite._drawn is not None:
+            self._erased.append(sprite._drawn)
+            self._unindex(sprite)
+            sprite._drawn = None
+        self._changed.discard(sprite)
+        self.sprites.remove(sprite)
+        sprite.layer = None
+
+    def clear(self):
+        for sprite in self.sprites[:]:
+            self.remove(sprite)
+
+    def set_background(self, background):
+        self.background = background
+        self._full = True
+
+    def invalidate(self):
+        """Redraw the whole layer at the next draw() (after dclear() for example)"""
+        self._full = True
+
+    def _cells_of(self, rect):
+        cx0 = rect[0] // CELL
+        cy0 = rect[1] // CELL
+        cx1 = (rect[0] + rect[2] - 1) // CELL
+        cy1 = (rect[1] + rect[3] - 1) // CELL
+        return [(cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)]
+
+    def _index(self, sprite):
+        for cell in self._cells_of(sprite._drawn):
+            bucket = self._cells.get(cell)
+            if bucket is None:
+                bucket = self._cells[cell] = set()
+            bucket.add(sprite)
+
+    def _unindex(self, sprite):
+        for cell in self._cells_of(sprite._drawn):
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(sprite)
+                if not bucket:
+                    del self._cells[cell]
+
+    def _sprites_over(self, rect):
+        """Sprites drawn over rect, bottom to top"""
+        found = set()
+        for cell in self._cells_of(rect):
+            bucket = self._cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        found = [s for s in found if _intersect(s._drawn, rect)]
+        found.sort(key=lambda s: (s.z, s._seq))
+        return found
+
+    def _restore(self, rect):
+        """Draw the background and the tilemap inside rect"""
+        bg = self.background
+        if isinstance(bg, int):
+            drect(rect[0], rect[1], rect[0] + rect[2] - 1, rect[1] + rect[3] - 1, bg)
+        elif bg is not None:
+            r = _intersect(rect, (0, 0, bg.width, bg.height))
+            if r is not None:
+                dsubimage(r[0], r[1], bg, r[0], r[1], r[2], r[3])
+        if self.tilemap is not None:
+            self.tilemap.draw(rect)
+
+    def draw(self):
+        """
+        Erase what changed since the last call by restoring the background,
+        then redraw the sprites over those regions. Returns the list of
+        (x, y, width, height) regions that were redrawn.
+        """
+        dirty = self._erased
+        self._erased = []
+        if self.tilemap is not None:
+            dirty += self.tilemap._changed
+            self.tilemap._changed = []
+
+        for sprite in self._changed:
+            if sprite._drawn is not None:
+                dirty.append(sprite._drawn)
+                self._unindex(sprite)
+                sprite._drawn = None
+            if sprite.visible:
+                sprite._drawn = _intersect(sprite.rect(), self.bounds)
+                if sprite._drawn is not None:
+                    dirty.append(sprite._drawn)
+                    self._index(sprite)
+        self._changed.clear()
+
+        if self._full:
+            self._full = False
+            rects = [self.bounds]
+        else:
+            rects = [r for r in (_intersect(r, self.bounds) for r in dirty) if r]
+            rects = _merge(rects)
+
+        for rect in rects:
+            self._restore(rect)
+            for sprite in self._sprites_over(rect):
+                sprite._draw(rect)
+        return rects
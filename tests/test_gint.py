@@ -0,0 +1,210 @@
+"""
+Tests of the gint emulator, run headless:
+
+    python -m pytest -q tests
+"""
+
+import array
+import os
+import sys
+import zlib
+
+os.environ["GINT_BACKEND"] = "headless"
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+os.environ.pop("GINT_FRAMES", None)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pygame
+import pytest
+
+import gint
+
+
+@pytest.fixture(autouse=True)
+def no_frame_limit():
+    gint._frame_limit = None
+    gint.clearevents()
+    yield
+    gint.clearevents()
+
+
+# -----------------------------------------------------------------------------
+#  Headless polling
+# -----------------------------------------------------------------------------
+
+def test_idle_polls_count_frames():
+    start = gint.frame_count()
+    for _ in range(10):
+        gint.pollevent()
+    assert gint.frame_count() > start
+    start = gint.frame_count()
+    for _ in range(10):
+        gint.pollevents()
+    assert gint.frame_count() > start
+
+
+def test_draw_then_poll_counts_one_frame():
+    start = gint.frame_count()
+    for _ in range(5):
+        gint.pollevent()
+        gint.dupdate()
+    assert gint.frame_count() == start + 5
+
+
+def test_script_reaches_poll_only_loop(tmp_path):
+    script = tmp_path / "input.txt"
+    script.write_text("# frame  event  key\n3  down  EXE\n5  up  EXE\n")
+    gint.inject_script(str(script))
+    start = gint.frame_count()
+    seen = []
+    for _ in range(200):
+        ev = gint.pollevent()
+        if ev.type != gint.KEYEV_NONE:
+            seen.append((ev.type, ev.key, gint.frame_count() - start))
+            if len(seen) == 2:
+                break
+    assert [s[:2] for s in seen] == [(gint.KEYEV_DOWN, gint.KEY_EXE),
+                                     (gint.KEYEV_UP, gint.KEY_EXE)]
+    assert seen[0][2] >= 3 and seen[1][2] >= 5
+
+
+# -----------------------------------------------------------------------------
+#  Text caches
+# -----------------------------------------------------------------------------
+
+def test_glyph_cache_byte_cap():
+    try:
+        gint.dtext_cache_set(glyph_bytes=4096, strings=False)
+        for color in range(0, 0xffff, 0x0841):
+            gint.dtext(0, 0, color, "The quick brown fox")
+        stats = gint.dtext_cache_stats()
+        assert 0 < stats['glyph_bytes'] <= 4096
+    finally:
+        gint.dtext_cache_set(glyph_bytes=1 << 20, strings=True)
+
+
+# -----------------------------------------------------------------------------
+#  Raw RGB565 images
+# -----------------------------------------------------------------------------
+
+def test_dsubimage_rgb565_region_checks():
+    data = bytes(4 * 4 * 2)     # 4x4 pixels, rows of 8 bytes
+    gint.dsubimage_rgb565(0, 0, data, 8, 2, 2, 2, 2)
+    with pytest.raises(ValueError):
+        gint.dsubimage_rgb565(0, 0, data, 8, 3, 0, 2, 1)    # past the row
+    with pytest.raises(ValueError):
+        gint.dsubimage_rgb565(0, 0, data, 8, 0, 3, 1, 2)    # past the end
+
+
+# -----------------------------------------------------------------------------
+#  Draw-call recording
+# -----------------------------------------------------------------------------
+
+def test_record_replay_array_arguments(tmp_path):
+    path = str(tmp_path / "draw.rec")
+    gint.record_start(path)
+    try:
+        gint.dclear(gint.C_WHITE)
+        gint.drect_many(array.array('h', [10, 10, 50, 40, 60, 70, 120, 90]),
+                        gint.C_RED)
+        gint.drect_many(memoryview(array.array('i', [5, 100, 30, 200])),
+                        gint.C_BLUE)
+        gint.dupdate()
+    finally:
+        gint.record_stop()
+    live = zlib.crc32(pygame.image.tostring(gint.vram, 'RGB'))
+
+    gint.dclear(gint.C_BLACK)
+    result = gint.replay(path, checksums=True)
+    assert result['frames'] == 1
+    assert result['checksums'] == [live]
+
+
+# -----------------------------------------------------------------------------
+#  Device cost model
+# -----------------------------------------------------------------------------
+
+def _cost(name, *args, **kwargs):
+    before = gint._cost_cycles
+    gint._cost_primitive(name, args, kwargs)
+    return gint._cost_cycles - before
+
+
+def test_cost_dtext_opt_grows_with_text():
+    opt = (0, 0, gint.C_BLACK, gint.C_NONE, gint.DTEXT_LEFT, gint.DTEXT_TOP)
+    short = _cost('dtext_opt', *opt, "ab")
+    long = _cost('dtext_opt', *opt, "ab" * 20)
+    assert long > short > gint.COST_TABLE['dtext_opt'][0]
+    assert _cost('dtext_opt', *opt, text="ab" * 20) == long
+    assert _cost('dtext_opt', *opt, "ab" * 20, 2) == short
+    assert _cost('dtext_opt', *opt, text="ab" * 20, size=2) == short
+    assert _cost('dtext', 0, 0, gint.C_BLACK, text="ab") \
+        == _cost('dtext', 0, 0, gint.C_BLACK, "ab")
+
+
+# -----------------------------------------------------------------------------
+#  Frame capture
+# -----------------------------------------------------------------------------
+
+def _capture_frames(path, wait):
+    gint.capture_start(path, buffer=1, wait=wait)
+    gint.profile_enable()
+    try:
+        for i in range(20):
+            gint.dclear(gint.C_WHITE)
+            gint.drect(i * 8, 0, i * 8 + 40, 300, gint.C_RED)
+            gint.dupdate()
+        frames = list(gint._profile_frames)[-19:]
+    finally:
+        gint.profile_enable(False)
+        stats = gint.capture_stop()
+    return stats, frames
+
+
+def test_capture_drops_frames_by_default(tmp_path):
+    stats, _ = _capture_frames(str(tmp_path / "drop.gif"), wait=False)
+    assert stats['dropped'] > 0
+    assert stats['encoded'] == stats['captured'] == 20 - stats['dropped']
+
+
+def test_capture_wait_keeps_every_frame(tmp_path):
+    stats, frames = _capture_frames(str(tmp_path / "wait.gif"), wait=True)
+    assert stats['dropped'] == 0 and stats['encoded'] == 20
+    # The wait is profiled as capture time, not as dupdate time
+    dupdate = sum(f[2]['dupdate'][1] for f in frames)
+    capture = sum(f[2]['capture'][1] for f in frames)
+    assert dupdate < capture
+
+
+# -----------------------------------------------------------------------------
+#  Simulated heap
+# -----------------------------------------------------------------------------
+
+def test_heap_counts_app_allocations_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(gint, '_numpy', None)   # Python path, with its table
+    gint.heap_enable(budget=64 << 20)
+    try:
+        before = gint.heap_stats()['used']
+        gint.capture_start(str(tmp_path / "frames.raw"))
+        gint.dtext(0, 0, gint.C_BLACK, "Heap")
+        gint.dsubimage_rgb565(0, 0, bytes(8), 4, 0, 0, 2, 1)
+        gint.dupdate()
+        data = bytearray(200_000)
+        used = gint.heap_stats()['used'] - before
+        assert 200_000 <= used < 220_000
+    finally:
+        gint.capture_stop()
+        gint.heap_enable(False)
+
+
+def test_heap_overflow_raises():
+    gint.heap_enable(budget=256 * 1024)
+    try:
+        data = bytearray(400_000)
+        with pytest.raises(MemoryError):
+            gint.dpixel(0, 0, gint.C_BLACK)
+        stats = gint.heap_stats()
+        assert stats['errors'] == 1 and stats['used'] >= len(data)
+    finally:
+        gint.heap_enable(False)
@@ -0,0 +1,305 @@
+#! /usr/bin/env python3
+
+"""
+Headless benchmark of the codecs of compression.py and lzw.py.
+
+Every codec compresses and decompresses every corpus file, keeping the best
+of --repeat runs, then once more under tracemalloc for the peak memory. The
+round trip must give back the original bytes. Corpus files are grouped by
+kind, from their extension:
+
+    markdown   .md                    the file itself
+    mobi       .mobi .prc .azw        each text record, decompressed
+    canvas     .gip                   the cpaint_demo canvas dump, unpacked
+               .png .bmp              the image as an RGB565 .gip dump (pygame)
+    svf        .svf                   the file itself
+
+Usage:
+    python tools/compress_bench.py                      # repository corpus
+    python tools/compress_bench.py book.mobi art.gip --codec lz77 --repeat 5
+    python tools/compress_bench.py --json bench.json    # save a baseline
+    python tools/compress_bench.py --baseline bench.json --tolerance 0.2
+
+Exits with status 1 if a round trip fails or, with --baseline, if a codec
+got slower, compresses worse or needs more memory than in the baseline.
+Speeds measured over less than MIN_SECONDS are not compared, and inputs a
+codec cannot take (odd sizes for rle16) are skipped.
+"""
+
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+import blockpack
+import compression
+import lzw
+
+try:
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+except ImportError:
+    pygame = None
+
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.15
+# Timings shorter than this are mostly noise: their speed is reported but
+# not compared with the baseline
+MIN_SECONDS = 0.05
+
+# Default corpus, relative to the repository
+DEFAULT_CORPUS = ["*.md", "*.mobi", "*.prc", "*.azw", "*.gip", "cpaint_*.png",
+                  "*.svf"]
+
+def _stream_decompress(data):
+    return compression.LZ77Decoder(data).read()
+
+# name -> (compress, decompress), both bytes -> bytes
+CODECS = {
+    "lz77": (compression.lz77_compress, compression.lz77_decompress),
+    "lz77-greedy": (lambda data: compression.lz77_compress(data, lazy=False),
+                    compression.lz77_decompress),
+    "lz77-stream": (compression.lz77_compress, _stream_decompress),
+    "lzw": (lzw.pack, lzw.unpack),
+    "rle": (compression.rle_compress, compression.rle_decompress),
+    "rle16": (compression.rle16_compress, compression.rle16_decompress),
+    "blocks": (lambda data: blockpack.pack(data, codec="auto", workers=1),
+               blockpack.unpack),
+}
+
+# name -> test of the inputs a codec accepts, other inputs are skipped
+ACCEPTS = {
+    "rle16": lambda data: len(data) % 2 == 0,     # 16-bit words only
+}
+
+# -----------------------------------------------------------------------------
+#  Corpus loaders: path -> list of (name, bytes)
+# -----------------------------------------------------------------------------
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return [(os.path.basename(path), f.read())]
+
+def load_mobi(path):
+    """Text records of a PalmDOC-compressed or uncompressed MOBI book"""
+    import mobi
+    db = mobi.PalmDB(path)
+    rec0 = db.get_record(0)
+    compressed, = struct.unpack(">H", rec0[0:2])
+    count, = struct.unpack(">H", rec0[8:10])
+    if compressed not in (1, 2):
+        raise ValueError(f"unsupported MOBI compression {compressed}")
+    name = os.path.basename(path)
+    records = []
+    for index in range(1, min(count + 1, db.record_count)):
+        data = db.get_record(index)
+        if compressed == 2:
+            data = compression.lz77_decompress(data)
+        records.append((f"{name}#{index}", data))
+    return records
+
+def load_gip(path):
+    """A cpaint_demo canvas dump, its pixels unpacked if saved as RLE16"""
+    with open(path, "rb") as f:
+        data = f.read()
+    w, h = struct.unpack("<II", data[:8])
+    if w & 0x80000000:
+        data = struct.pack("<II", w & 0x7fffffff, h) + compression.rle16_decompress(data[8:])
+    return [(os.path.basename(path), data)]
+
+def load_image(path):
+    """An image as the .gip canvas dump cpaint_demo would save"""
+    if pygame is None:
+        raise ValueError("pygame is needed to convert images")
+    img = pygame.image.load(path)
+    w, h = img.get_size()
+    canvas = pygame.Surface((w, h), 0, 16, (0xf800, 0x07e0, 0x001f, 0))
+    canvas.blit(img, (0, 0))
+    raw = canvas.get_buffer().raw
+    pitch = canvas.get_pitch()
+    pixels = b"".join(raw[y * pitch:y * pitch + w * 2] for y in range(h))
+    return [(os.path.basename(path), struct.pack("<II", w, h) + pixels)]
+
+# extension -> (kind, loader)
+LOADERS = {
+    ".md": ("markdown", load_file),
+    ".mobi": ("mobi", load_mobi),
+    ".prc": ("mobi", load_mobi),
+    ".azw": ("mobi", load_mobi),
+    ".gip": ("canvas", load_gip),
+    ".png": ("canvas", load_image),
+    ".bmp": ("canvas", load_image),
+    ".svf": ("svf", load_file),
+}
+
+def load_corpus(patterns):
+    """kind -> list of (name, bytes), from files, directories and globs"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        if any(c in pattern for c in "*?["):
+            paths += sorted(glob.glob(pattern))
+        else:
+            paths.append(pattern)
+    corpus = {}
+    for path in paths:
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in LOADERS:
+            continue
+        kind, loader = LOADERS[ext]
+        try:
+            items = loader(path)
+        except (OSError, ValueError) as e:
+            print(f"skipping {path}: {e}", file=sys.stderr)
+            continue
+        corpus.setdefault(kind, []).extend(i for i in items if i[1])
+    return corpus
+
+# -----------------------------------------------------------------------------
+#  Measurement
+# -----------------------------------------------------------------------------
+
+def _best(fn, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(arg)
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best, result
+
+def measure(codec, items, repeat):
+    compress, decompress = CODECS[codec]
+    size = packed = 0
+    t_compress = t_decompress = 0.0
+    accepts = ACCEPTS.get(codec)
+    peak = 0
+    failed = []
+    skipped = []
+    for name, data in items:
+        if accepts is not None and not accepts(data):
+            skipped.append(name)
+            continue
+        t, out = _best(compress, data, repeat)
+        t_compress += t
+        t, back = _best(decompress, out, repeat)
+        t_decompress += t
+        size += len(data)
+        packed += len(out)
+        if back != data:
+            failed.append(name)
+
+        tracemalloc.start()
+        decompress(compress(data))
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "codec": codec,
+        "files": len(items) - len(skipped),
+        "bytes": size,
+        "compressed": packed,
+        "ratio": packed / size if size else 0.0,
+        "compress_mbps": size / t_compress / 1e6 if t_compress else 0.0,
+        "decompress_mbps": size / t_decompress / 1e6 if t_decompress else 0.0,
+        "compress_s": t_compress,
+        "decompress_s": t_decompress,
+        "peak_kb": peak / 1024,
+        "roundtrip": not failed,
+        "failed": failed,
+        "skipped": skipped,
+    }
+
+def regressions(result, base, tolerance):
+    """Why result is worse than base, an empty list if it is not"""
+    found = []
+    for key, seconds in (("compress_mbps", "compress_s"),
+                         ("decompress_mbps", "decompress_s")):
+        if min(result[seconds], base.get(seconds, 0)) < MIN_SECONDS:
+            continue
+        if result[key] < base[key] * (1 - tolerance):
+            found.append(f"{key} {result[key]:.2f} < {base[key]:.2f}")
+    if result["ratio"] > base["ratio"] + 0.001:
+        found.append(f"ratio {result['ratio']:.1%} > {base['ratio']:.1%}")
+    if base["peak_kb"] and result["peak_kb"] > base["peak_kb"] * (1 + tolerance):
+        found.append(f"peak {result['peak_kb']:.0f} KB > {base['peak_kb']:.0f} KB")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compression.py and lzw.py")
+    parser.add_argument("corpus", nargs="*",
+                        help="files, directories or globs (default: repository corpus)")
+    parser.add_argument("--codec", action="append", choices=sorted(CODECS),
+                        help="codec to run, can be repeated (default: all)")
+    parser.add_argument("--kind", action="append",
+                        help="corpus kind to run, can be repeated (default: all)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"runs per measurement, the best is kept (default {DEFAULT_REPEAT})")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare with results previously written by --json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown or memory growth allowed against the baseline "
+                             f"(default {DEFAULT_TOLERANCE})")
+    args = parser.parse_args()
+
+    patterns = args.corpus or [os.path.join(ROOT, p) for p in DEFAULT_CORPUS]
+    corpus = load_corpus(patterns)
+    if args.kind:
+        corpus = {k: v for k, v in corpus.items() if k in args.kind}
+    if not corpus:
+        print("empty corpus")
+        return 1
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            for r in json.load(f)["results"]:
+                baseline[(r["codec"], r["kind"])] = r
+
+    results = []
+    bad = 0
+    print(f"{'codec':<12} {'kind':<9} {'bytes':>9} {'ratio':>7} {'comp':>10} "
+          f"{'decomp':>10} {'peak':>8}  status")
+    for codec in args.codec or CODECS:
+        for kind, items in sorted(corpus.items()):
+            r = measure(codec, items, max(1, args.repeat))
+            r["kind"] = kind
+            if not r["files"]:
+                print(f"{codec:<12} {kind:<9} skipped: no input it accepts")
+                continue
+            base = baseline.get((codec, kind))
+            r["regressions"] = regressions(r, base, args.tolerance) if base else []
+            results.append(r)
+            status = "ok" if r["roundtrip"] else "ROUND TRIP FAILED"
+            if r["regressions"]:
+                status += "  REGRESSION: " + ", ".join(r["regressions"])
+            if not r["roundtrip"] or r["regressions"]:
+                bad += 1
+            print(f"{codec:<12} {kind:<9} {r['bytes']:>9} {r['ratio']:>7.1%} "
+                  f"{r['compress_mbps']:>5.2f} MB/s {r['decompress_mbps']:>5.2f} MB/s "
+                  f"{r['peak_kb']:>5.0f} KB  {status}")
+            for name in r["failed"]:
+                print(f"    round trip failed: {name}")
+            for name in r["skipped"]:
+                print(f"    skipped: {name}")
+
+    print(f"{len(results) - bad}/{len(results)} ok"
+          + (f" against {args.baseline}" if args.baseline else ""))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, indent=1)
+    return 1 if bad else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#! /usr/bin/env python3
+
+"""
+Replay a gint draw-call log (recorded with GINT_RECORD=<file> or
+gint.record_start()) without running the app, as fast as possible.
+
+Usage:
+    GINT_RECORD=asteroids.rec GINT_FRAMES=300 python asteroids.py
+    python tools/gint_replay.py asteroids.rec --checksums base.json
+    python tools/gint_replay.py asteroids.rec --compare base.json
+
+Replays are headless unless --window is given. Checksums are the CRC32 of
+VRAM after every frame, so a rendering change in gint.py shows up as the
+first frame whose checksum differs.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a gint draw-call log")
+    parser.add_argument("log", help="draw-call log to replay")
+    parser.add_argument("--window", action="store_true",
+                        help="show the replay in a window")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="replay the log several times, keep the best time")
+    parser.add_argument("--checksums", metavar="JSON",
+                        help="write per-frame VRAM checksums to this file")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="compare per-frame VRAM checksums with this file")
+    args = parser.parse_args()
+
+    os.environ["GINT_BACKEND"] = "window" if args.window else "headless"
+    os.environ.pop("GINT_RECORD", None)
+    os.environ.pop("GINT_FRAMES", None)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import gint
+
+    checksums = bool(args.checksums or args.compare)
+    best = None
+    for _ in range(max(1, args.repeat)):
+        gint.vram.fill(gint.C_WHITE)     # VRAM as left by the import
+        result = gint.replay(args.log, checksums=checksums)
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+
+    frames = max(1, best["frames"])
+    print(f"{best['frames']} frames, {best['calls']} calls in "
+          f"{best['seconds']:.3f}s ({best['seconds'] * 1000 / frames:.2f} ms/frame)")
+
+    if args.checksums:
+        with open(args.checksums, "w") as f:
+            json.dump(best["checksums"], f)
+
+    if args.compare:
+        with open(args.compare) as f:
+            expected = json.load(f)
+        actual = best["checksums"]
+        for frame, (a, e) in enumerate(zip(actual, expected), 1):
+            if a != e:
+                print(f"frame {frame}: checksum {a:08x}, expected {e:08x}")
+                return 1
+        if len(actual) != len(expected):
+            print(f"{len(actual)} frames replayed, expected {len(expected)}")
+            return 1
+        print("all frames match")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+
+"""
+Cold-start report for the apps and modules built on gint.
+
+Every entry point is started in a fresh interpreter with `python -X importtime`,
+headless and limited to one frame (GINT_FRAMES=1), so the wall time covers
+interpreter startup, imports and everything the app does up to its first
+dupdate(). Modules that never draw simply finish importing.
+
+Usage:
+    python tools/startup_report.py                   # every module using gint
+    python tools/startup_report.py asteroids.py cinput.py --top 5
+    python tools/startup_report.py --budget 250 --json startup.json
+
+Exits with status 1 if an entry point is over budget or fails.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+DEFAULT_BUDGET_MS = 300
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def entry_points():
+    """Top-level modules of the repository that use gint"""
+    found = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "*.py"))):
+        name = os.path.basename(path)
+        if name.startswith("gint"):
+            continue
+        with open(path, encoding="utf-8", errors="replace") as f:
+            source = f.read()
+        if re.search(r"^(from gint import|import gint)", source, re.M):
+            found.append(name)
+    return found
+
+def measure(script, timeout):
+    env = dict(os.environ, GINT_BACKEND="headless", GINT_FRAMES="1",
+               PYGAME_HIDE_SUPPORT_PROMPT="1")
+    for var in ("GINT_PROFILE", "GINT_RECORD", "GINT_COSTMODEL", "GINT_HEAP"):
+        env.pop(var, None)
+    t0 = time.perf_counter()
+    try:
+        proc = subprocess.run([sys.executable, "-X", "importtime", script],
+                              cwd=ROOT, env=env, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              timeout=timeout, text=True)
+        status = "ok" if proc.returncode == 0 else f"exit {proc.returncode}"
+        stderr = proc.stderr
+    except subprocess.TimeoutExpired as e:
+        status = "timeout"
+        stderr = e.stderr.decode() if isinstance(e.stderr, bytes) else (e.stderr or "")
+    wall = (time.perf_counter() - t0) * 1000
+
+    imports = {}   # module -> cumulative ms, wherever it was first imported
+    selfs = []     # (self ms, module)
+    for match in _IMPORTTIME.finditer(stderr):
+        self_us, cumulative_us, indent, module = match.groups()
+        selfs.append((int(self_us) / 1000, module))
+        imports.setdefault(module, int(cumulative_us) / 1000)
+    return {
+        "script": script,
+        "status": status,
+        "wall_ms": wall,
+        "gint_ms": imports.get("gint", 0.0),
+        "pygame_ms": imports.get("pygame", 0.0),
+        "slowest": sorted(selfs, reverse=True),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start of gint apps")
+    parser.add_argument("scripts", nargs="*",
+                        help="entry points (default: every top-level module using gint)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"cold-start budget in ms (default {DEFAULT_BUDGET_MS})")
+    parser.add_argument("--top", type=int, default=0,
+                        help="also list the N slowest imports of every entry point")
+    parser.add_argument("--timeout", type=float, default=30,
+                        help="seconds before an entry point is given up on")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    args = parser.parse_args()
+
+    scripts = args.scripts or entry_points()
+    results = []
+    print(f"{'entry point':<24} {'total':>9} {'gint':>9} {'pygame':>9}  status")
+    for script in scripts:
+        r = measure(script, args.timeout)
+        r["over_budget"] = r["wall_ms"] > args.budget
+        results.append(r)
+        flag = "  OVER BUDGET" if r["over_budget"] else ""
+        print(f"{script:<24} {r['wall_ms']:>7.0f}ms {r['gint_ms']:>7.0f}ms "
+              f"{r['pygame_ms']:>7.0f}ms  {r['status']}{flag}")
+        for ms, module in r["slowest"][:args.top]:
+            print(f"    {ms:>7.1f}ms  {module}")
+
+    failed = [r for r in results if r["over_budget"] or r["status"] != "ok"]
+    print(f"{len(results) - len(failed)}/{len(results)} within {args.budget:.0f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"budget_ms": args.budget, "results": results}, f, indent=1)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())